@@ -1,24 +1,43 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
+from flask.json.provider import JSONProvider
 from langchain.chains import TransformChain, SequentialChain
 from langchain.prompts import PromptTemplate
-from langchain.llms import LlamaCpp
 from langchain.output_parsers import StructuredOutputParser, ResponseSchema
+from mapping_engine import compile_mapping
+from model_registry import models, llm_cache, LLAMA_CONCURRENCY
+from jobs import Job, JobManager, JobQueueFull
+from mapping_cache import MappingCache, structural_fingerprint
+from json_repair import stream_json_with_repair
+from grammar import grammar_kwargs, mapping_gbnf, response_schemas_gbnf
+from prefix_cache import PrefixCache, template_prefix
+from prompt_compaction import fit_json_input
+from schema_validation import check_mapping, check_output, conform_to_schemas, find_schema_problems
+from step_store import RunNotFound, StepStore
+import json_codec
+from metrics import GenerationTimer, cache_requests, registry as metrics_registry, request_timings, timed_stage
 import json
-import re
+import os
+import queue
 import logging
+import threading
 
 # Configuração do logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Provider JSON do Flask sobre o codec do projeto (orjson quando instalado)
+class JsonCodecProvider(JSONProvider):
+    def dumps(self, obj, **kwargs):
+        return json_codec.dumps(obj, default=kwargs.get("default", str))
+
+    def loads(self, s, **kwargs):
+        return json_codec.loads(s)
+
+
 app = Flask(__name__)
+app.json = JsonCodecProvider(app)
 
-# Configuração do modelo LlamaCpp
-llm = LlamaCpp(
-    model_path="models/codellama-7b.Q4_K_M.gguf",  # Caminho para o modelo
-    n_gpu_layers=40,  # Número de camadas do modelo a serem carregadas na GPU
-    n_batch=512,  # Tamanho do lote para processamento
-    verbose=False,  # Desabilitar logs detalhados
-)
+# Modelo LlamaCpp usado pelo workflow (carregado sob demanda pelo registro de modelos)
+MODEL_NAME = "codellama-7b"
 
 # Exemplo de JSON de entrada
 original_json = {
@@ -57,104 +76,29 @@ response_schemas = [
 # Configurar o JSON Output Parser
 output_parser = StructuredOutputParser.from_response_schemas(response_schemas)
 
-# Função para extrair dados dinamicamente
-def extract_data(data, mapping):
-    """
-    Extrai dados dinamicamente de um JSON usando um mapeamento.
-    """
-    output = {}
-
-    for key, value in mapping.items():
-        if isinstance(value, dict):
-            # Tratar mapeamentos para valores simples
-            path = value.get("path", [])
-            default = value.get("default", None)
-            current_data = data
-
-            # Percorrer o caminho no JSON
-            for step in path:
-                if isinstance(current_data, list):
-                    # Se o caminho aponta para uma lista, iterar sobre os itens
-                    current_data = [item.get(step, {}) for item in current_data]
-                else:
-                    # Se o caminho aponta para um objeto, acessar diretamente
-                    current_data = current_data.get(step, {})
-
-                # Se o valor for None, interromper o loop
-                if current_data is None:
-                    break
-
-            # Se o caminho resultou em uma lista, pegar o primeiro item
-            if isinstance(current_data, list) and current_data:
-                current_data = current_data[0]
-
-            # Adicionar o valor ao JSON de saída
-            output[key] = current_data if current_data is not None else default
-
-        elif isinstance(value, list):
-            # Tratar mapeamentos para listas de objetos
-            path = value[0].get("path", [])
-            current_data = data
-
-            # Percorrer o caminho no JSON
-            for step in path:
-                if isinstance(current_data, list):
-                    # Se o caminho aponta para uma lista, iterar sobre os itens
-                    current_data = [item.get(step, {}) for item in current_data]
-                else:
-                    # Se o caminho aponta para um objeto, acessar diretamente
-                    current_data = current_data.get(step, {})
-
-                # Se o valor for None, interromper o loop
-                if current_data is None:
-                    break
-
-            # Extrair os itens da lista
-            output[key] = []
-            for item in current_data:
-                extracted_item = {}
-                for sub_key, sub_value in value[0].items():
-                    if sub_key == "path":
-                        continue
-                    extracted_item[sub_key] = item.get(sub_value, None)
-                output[key].append(extracted_item)
-
-    return output
-
-
-# Função para limpar a saída do modelo
-def clean_model_output(output: str) -> str:
-    """
-    Limpa a saída do modelo para garantir que seja um JSON válido.
-    """
-    logging.info(f"Saída bruta do modelo: {output}")  # Log da saída bruta
-
-    # Remover texto adicional que não faz parte do JSON
-    cleaned_output = re.sub(r"^[^{]*", "", output)
-    cleaned_output = re.sub(r"[^}]*$", "", cleaned_output)
+# Gramáticas GBNF que restringem a geração ao formato esperado (desativadas com LLM_GRAMMAR=0)
+use_grammar = os.environ.get("LLM_GRAMMAR", "1") != "0"
+mapping_grammar = mapping_gbnf(response_schemas) if use_grammar else None
+output_grammar = response_schemas_gbnf(response_schemas) if use_grammar else None
 
-    # Tentar parsear o JSON
-    try:
-        json.loads(cleaned_output)
-        logging.info(f"Saída limpa e válida: {cleaned_output}")  # Log da saída limpa
-        return cleaned_output
-    except json.JSONDecodeError as e:
-        logging.error(f"Erro ao parsear JSON: {e}")
-        raise ValueError("A saída do modelo não é um JSON válido.")
+# Cache de mapeamentos por estrutura do JSON de entrada (persistido se MAPPING_CACHE_PATH for definido)
+mapping_cache = MappingCache(
+    max_entries=int(os.environ.get("MAPPING_CACHE_SIZE", "1024")),
+    path=os.environ.get("MAPPING_CACHE_PATH"),
+)
 
+# Snapshots do KV-cache do LlamaCpp para os prefixos estáticos dos prompts
+prefix_cache = PrefixCache(
+    max_entries=int(os.environ.get("PREFIX_CACHE_SIZE", "8")),
+    max_bytes=int(os.environ.get("PREFIX_CACHE_BYTES", str(1024 * 1024 * 1024))),
+)
 
-# Etapa 1: TransformChain para gerar o mapeamento dinamicamente com base no schema
-def generate_mapping(inputs: dict) -> dict:
-    """
-    Função para gerar o mapeamento dinamicamente com base no schema.
-    """
-    mapping_prompt = PromptTemplate(
-        template="""
+# Prompt do mapeamento: instruções e exemplo constantes antes do JSON de entrada,
+# para que esse prefixo seja avaliado uma única vez pelo modelo
+mapping_prompt = PromptTemplate(
+    template="""
         Given the JSON structure, generate a valid JSOM object mapping.
 
-        JSON Structure:
-        {json_input}
-
         Mapping Example:
         {{
             "user_id": {{"path": ["data", "user_info", "user_id"]}},
@@ -170,30 +114,69 @@ def generate_mapping(inputs: dict) -> dict:
             ]
         }}
 
+        JSON Structure:
+        {json_input}
+
         Mapping:
         """,
-        input_variables=["schema", "json_input"]
-    )
+    input_variables=["schema", "json_input"]
+)
+mapping_prefix = template_prefix(mapping_prompt, "json_input")
 
-    # Reduzir o schema para caber no limite de tokens
-    schema_str = json.dumps([{"name": schema.name, "description": schema.description} for schema in response_schemas], indent=2)
-    json_input_str = json.dumps(inputs["json_input"], indent=2)
+# Orçamento de tokens para o esqueleto do JSON de entrada no prompt de mapeamento
+JSON_INPUT_TOKEN_BUDGET = int(os.environ.get("JSON_INPUT_TOKEN_BUDGET", "256"))
 
-    # Verificar o tamanho do prompt
-    prompt_text = mapping_prompt.format(schema=schema_str, json_input=json_input_str)
-    logging.info(f"Tamanho do prompt: {len(prompt_text.split())} tokens")
+# Etapa 1: TransformChain para gerar o mapeamento dinamicamente com base no schema
+def prepare_prefix(llm, prefix):
+    # Chamada só quando o modelo vai gerar: num acerto do cache de respostas
+    # não há prefixo a avaliar ou restaurar
+    prefix_result = prefix_cache.prepare(llm, prefix)
+    if prefix_result:
+        cache_requests.inc(cache="prefix", result=prefix_result)
 
-    # Enviar o prompt para a LLM
-    logging.info(f"Prompt enviado para a LLM (generate_mapping): {prompt_text}")
-    mapping_output = llm.invoke(prompt_text)
 
-    logging.info(f"Resposta da LLM (generate_mapping): {mapping_output}")
+@timed_stage("generate_mapping")
+def generate_mapping(inputs: dict, on_token=None) -> dict:
+    """
+    Função para gerar o mapeamento dinamicamente com base no schema.
+    """
+    # Entradas com a mesma estrutura reaproveitam o mapeamento já gerado
+    fingerprint = structural_fingerprint(inputs["json_input"], response_schemas)
+    mapping = mapping_cache.get(fingerprint)
+    cache_requests.inc(cache="mapping", result="miss" if mapping is None else "hit")
+    if mapping is not None:
+        logging.info(f"Mapeamento encontrado no cache: {fingerprint}")
+        return {"mapping": mapping}
 
-    # Limpar a saída do modelo
-    cleaned_output = clean_model_output(mapping_output)
+    # Reduzir o schema para caber no limite de tokens
+    schema_str = json.dumps([{"name": schema.name, "description": schema.description} for schema in response_schemas], indent=2)
 
-    # Converter o mapeamento de string para JSON
-    mapping = json.loads(cleaned_output)
+    with models.acquire(MODEL_NAME) as llm:
+        # O mapeamento só depende da estrutura: enviar o esqueleto do JSON,
+        # medido com o tokenizer do modelo e ajustado ao orçamento
+        json_input_str, json_input_tokens = fit_json_input(inputs["json_input"], llm.get_num_tokens, JSON_INPUT_TOKEN_BUDGET)
+
+        # Verificar o tamanho do prompt
+        prompt_text = mapping_prompt.format(schema=schema_str, json_input=json_input_str)
+        logging.info(f"Tamanho do prompt: {llm.get_num_tokens(prompt_text)} tokens ({json_input_tokens} do JSON de entrada)")
+
+        # Enviar o prompt para a LLM
+        logging.info(f"Prompt enviado para a LLM (generate_mapping): {prompt_text}")
+        # Gerar com streaming, extraindo o JSON à medida que os tokens chegam.
+        # Saídas quase válidas são reparadas em vez de falhar a requisição; um
+        # reparo que perdeu chaves do schema é recusado, para não ir ao cache
+        with GenerationTimer("generate_mapping", llm, prompt_text, on_token) as timer:
+            mapping = stream_json_with_repair(
+                llm, prompt_text, "generate_mapping", on_token=timer.on_token,
+                validate=lambda value: check_mapping(value, response_schemas),
+                before_generate=lambda: prepare_prefix(llm, mapping_prefix),
+                **grammar_kwargs(llm, mapping_grammar)
+            )
+
+    logging.info(f"Resposta da LLM (generate_mapping): {mapping}")
+
+    # O parser já entrega o mapeamento decodificado
+    mapping_cache.put(fingerprint, mapping)
 
     return {"mapping": mapping}
 
@@ -205,11 +188,12 @@ generate_mapping_chain = TransformChain(
 )
 
 # Etapa 2: TransformChain para extrair dados dinamicamente
+@timed_stage("extract_data")
 def transform_extract_data(inputs: dict) -> dict:
     """
     Função de transformação para extrair dados dinamicamente.
     """
-    extracted_data = extract_data(inputs["json_input"], inputs["mapping"])
+    extracted_data = compile_mapping(inputs["mapping"]).extract(inputs["json_input"])
     return {"extracted_data": extracted_data}
 
 
@@ -220,11 +204,13 @@ extract_chain = TransformChain(
 )
 
 # Etapa 3: TransformChain para converter o JSON extraído em string
+@timed_stage("json_to_string")
 def transform_json_to_string(inputs: dict) -> dict:
     """
     Função de transformação para converter o JSON extraído em string.
     """
-    json_string = json.dumps(inputs["extracted_data"], indent=4)
+    # Fronteira com a LLM: JSON compacto (menos tokens, sem cópias indentadas)
+    json_string = json_codec.dumps(inputs["extracted_data"])
     return {"json_string": json_string}
 
 
@@ -241,24 +227,43 @@ prompt = PromptTemplate(
     input_variables=["json_string"],
     partial_variables={"format_instructions": format_instructions}
 )
+output_prefix = template_prefix(prompt, "json_string")
 
-# Etapa 5: Chain para gerar a saída do modelo
-def generate_output(inputs: dict) -> dict:
+# Função para gerar um JSON com a LLM a partir de um prompt de extração
+def generate_json(prompt_text: str, prefix: str, grammar: str, on_token=None, stage: str = "generate_output", validate=None):
     """
-    Função para gerar a saída do modelo de linguagem.
+    Gera a resposta com streaming, reaproveitando o prefixo do prompt e
+    restringindo a saída com a gramática. Retorna o JSON decodificado; saídas
+    inválidas passam pelo reparo (validado com ``validate``).
     """
-    _input = prompt.format_prompt(json_string=inputs["json_string"])
+    logging.info(f"Prompt enviado para a LLM ({stage}): {prompt_text}")
 
-    logging.info(f"Prompt enviado para a LLM (generate_output): {_input.to_string()}")
+    with models.acquire(MODEL_NAME) as llm:
+        with GenerationTimer(stage, llm, prompt_text, on_token) as timer:
+            output = stream_json_with_repair(
+                llm, prompt_text, stage, on_token=timer.on_token, validate=validate,
+                before_generate=lambda: prepare_prefix(llm, prefix), **grammar_kwargs(llm, grammar)
+            )
 
-    output = llm.invoke(_input.to_string())
+    logging.info(f"Resposta da LLM ({stage}): {output}")
+    return output
 
-    logging.info(f"Resposta da LLM (generate_output): {output}")
 
-    # Limpar a saída do modelo
-    cleaned_output = clean_model_output(output)
+# Etapa 5: Chain para gerar a saída do modelo
+@timed_stage("generate_output")
+def generate_output(inputs: dict, on_token=None) -> dict:
+    """
+    Função para gerar a saída do modelo de linguagem.
+    """
+    _input = prompt.format_prompt(json_string=inputs["json_string"])
+    output = generate_json(
+        _input.to_string(), output_prefix, output_grammar, on_token=on_token,
+        validate=lambda value: check_output(value, response_schemas),
+    )
 
-    return {"model_output": cleaned_output}
+    # O objeto já decodificado (uma única vez) pelo parser incremental segue
+    # para a validação, sem voltar a ser texto
+    return {"model_output": output}
 
 
 generate_output_chain = TransformChain(
@@ -268,11 +273,13 @@ generate_output_chain = TransformChain(
 )
 
 # Etapa 6: Chain para parsear a saída do modelo
+@timed_stage("parse_output")
 def parse_output(inputs: dict) -> dict:
     """
     Função para parsear a saída do modelo.
     """
-    parsed_output = output_parser.parse(inputs["model_output"])
+    # A saída já chega decodificada: validar as chaves do schema sem parsear de novo
+    parsed_output = check_output(inputs["model_output"], response_schemas)
     return {"parsed_output": parsed_output}
 
 
@@ -282,32 +289,138 @@ parse_output_chain = TransformChain(
     transform=parse_output
 )
 
+# Etapa 3 (atalho): validar os dados extraídos contra o schema e pedir à LLM
+# apenas os campos ausentes ou ambíguos, em vez de regenerar a saída inteira
+@timed_stage("complete_output")
+def complete_output(inputs: dict) -> dict:
+    """
+    Função para montar a saída final a partir dos dados extraídos.
+    """
+    extracted_data = inputs["extracted_data"]
+    problems = find_schema_problems(extracted_data, response_schemas)
+    parsed_output = conform_to_schemas(extracted_data, response_schemas)
+
+    cache_requests.inc(cache="schema_fast_path", result="miss" if problems else "hit")
+    if not problems:
+        logging.info("Dados extraídos conformes ao schema: geração da saída pela LLM ignorada")
+        return {"parsed_output": parsed_output}
+
+    logging.info(f"Campos gerados pela LLM (ausentes ou ambíguos): {problems}")
+    missing_schemas = [schema for schema in response_schemas if schema.name in problems]
+    missing_parser = StructuredOutputParser.from_response_schemas(missing_schemas)
+    missing_prompt = PromptTemplate(
+        template=prompt.template,
+        input_variables=["json_string"],
+        partial_variables={"format_instructions": missing_parser.get_format_instructions()}
+    )
+
+    # Os campos ausentes são procurados no JSON de entrada original
+    output = generate_json(
+        missing_prompt.format(json_string=json_codec.dumps(inputs["json_input"])),
+        template_prefix(missing_prompt, "json_string"),
+        response_schemas_gbnf(missing_schemas) if use_grammar else None,
+        stage="complete_output",
+        validate=lambda value: check_output(value, missing_schemas),
+    )
+    parsed_output.update(check_output(output, missing_schemas))
+
+    return {"parsed_output": conform_to_schemas(parsed_output, response_schemas)}
+
+
+complete_output_chain = TransformChain(
+    input_variables=["json_input", "extracted_data"],
+    output_variables=["parsed_output"],
+    transform=complete_output
+)
+
 # Criar a SequentialChain para encadear todas as etapas
 sequential_chain = SequentialChain(
     chains=[
         generate_mapping_chain,  # Etapa 1: Gerar mapeamento
         extract_chain,           # Etapa 2: Extrair dados
-        json_to_string_chain,    # Etapa 3: Converter para string
-        generate_output_chain,   # Etapa 4: Gerar saída do modelo
-        parse_output_chain       # Etapa 5: Parsear saída
+        complete_output_chain    # Etapa 3: Validar e completar a saída (LLM só para campos ausentes)
     ],
     input_variables=["json_input"],
     output_variables=["parsed_output"]
 )
 
+# Evento de progresso reportado ao concluir cada etapa da SequentialChain, com
+# a última etapa da interface (``run_steps``) que ele conclui: complete_output
+# faz o papel das três etapas finais
+workflow_stages = [
+    (generate_mapping_chain, "mapping_done", "generate_mapping"),
+    (extract_chain, "extraction_done", "extract_data"),
+    (complete_output_chain, "parsed", "parse_output"),
+]
+
+# Função para executar o workflow reportando o progresso de cada etapa
+def run_workflow(json_input, report):
+    """
+    Executa as etapas da SequentialChain uma a uma, reportando o fim de cada uma.
+    """
+    values = {"json_input": json_input}
+    for chain, stage, _ in workflow_stages:
+        values.update(chain.invoke(values))
+        report(stage)
+    return values["parsed_output"]
+
+
+# Pool de workers dos jobs assíncronos (um por cópia do modelo, por padrão)
+job_manager = JobManager(
+    run_workflow,
+    max_workers=int(os.environ.get("JOB_WORKERS", LLAMA_CONCURRENCY)),
+    max_pending=int(os.environ.get("JOB_QUEUE_SIZE", "32")),
+)
+
+# Função para formatar um evento Server-Sent Events
+def format_sse(event: str, data) -> str:
+    """
+    Formata um evento SSE com os dados serializados em JSON.
+    """
+    return f"event: {event}\ndata: {json_codec.dumps(data)}\n\n"
+
+# Aquecimento do modelo em segundo plano: carrega os pesos e faz uma geração
+# curta antes da primeira requisição. Sem ele, o modelo é carregado sob demanda.
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "0") == "1"
+WARMUP_PROMPT = os.environ.get("WARMUP_PROMPT", "{")
+
+
+def warmup_generation(llm):
+    # Sem o cache de respostas: uma resposta em cache não faz a avaliação que
+    # traz os pesos para a memória. A cópia rasa compartilha o modelo carregado.
+    llm.model_copy(update={"cache": False}).invoke(WARMUP_PROMPT, max_tokens=1)
+
+
+def warmup_model():
+    """
+    Carrega e aquece o modelo do workflow, registrando falhas no log.
+    """
+    try:
+        models.warmup(MODEL_NAME, warmup_generation)
+    except Exception as e:
+        logging.error(f"Erro ao aquecer o modelo {MODEL_NAME}: {e}")
+
+
+def start_warmup():
+    threading.Thread(target=warmup_model, name="model-warmup", daemon=True).start()
+
 # Rota inicial
 @app.route("/")
 def index():
-    return render_template("index.html")
+    # A interface acompanha os jobs pelos mesmos eventos que run_workflow emite
+    job_stages = [[stage, list(run_steps).index(step)] for _, stage, step in workflow_stages]
+    return render_template("index.html", job_stages=job_stages)
 
 # Rota para iniciar o processo
 @app.route("/start", methods=["POST"])
 def start_process():
     try:
-        result = sequential_chain.invoke({"json_input": original_json})
+        with request_timings() as timings:
+            result = sequential_chain.invoke({"json_input": original_json})
         return jsonify({
             "status": "success",
-            "output": result["parsed_output"]
+            "output": result["parsed_output"],
+            "timings": timings
         })
     except Exception as e:
         logging.error(f"Erro ao iniciar o processo: {e}")
@@ -316,30 +429,216 @@ def start_process():
             "message": str(e)
         })
 
+# Rotas de saúde: /healthz indica que o processo está no ar; /readyz só
+# indica pronto com o modelo carregado e aquecido (quando MODEL_WARMUP=1)
+@app.route("/healthz")
+def healthz():
+    return jsonify({"status": "ok"})
+
+
+@app.route("/readyz")
+def readyz():
+    model = models.status(MODEL_NAME)
+    ready = model["warm"] or not MODEL_WARMUP
+    body = {
+        "status": "ready" if ready else "warming",
+        "warmup": MODEL_WARMUP,
+        "model": model,
+        "llm_cache": llm_cache is not None,
+        "mapping_cache": mapping_cache.max_entries > 0,
+    }
+    return jsonify(body), 200 if ready else 503
+
+# Rota com as métricas no formato texto do Prometheus
+@app.route("/metrics")
+def metrics():
+    return Response(metrics_registry.render(), mimetype="text/plain; version=0.0.4")
+
+# Rota para enviar o workflow como job assíncrono
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    data = request.get_json(silent=True) or {}
+    try:
+        job = job_manager.submit(data.get("json_input", original_json))
+    except JobQueueFull as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+    return jsonify({"status": "accepted", "job_id": job.id}), 202
+
+# Rota para consultar o estado de um job
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job não encontrado."}), 404
+    return jsonify(job.to_dict())
+
+# Rota para acompanhar o progresso de um job via Server-Sent Events
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job não encontrado."}), 404
+
+    def generate():
+        since = 0
+        while True:
+            events = job.wait_events(since, timeout=15)
+            if not events:
+                # Manter a conexão aberta enquanto a inferência roda
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                if event["event"] in Job.TERMINAL_EVENTS:
+                    yield format_sse(event["event"], job.to_dict())
+                    return
+                yield format_sse(event["event"], event)
+            since += len(events)
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream")
+
+# Função para ler documentos NDJSON de forma incremental
+def iter_ndjson(stream):
+    """
+    Lê um documento JSON por linha do stream, sem carregar o corpo inteiro.
+    """
+    for line_number, line in enumerate(iter(stream.readline, b""), start=1):
+        line = line.strip()
+        if line:
+            yield line_number, line
+
+# Rota para extrair vários documentos em lote (NDJSON)
+@app.route("/extract/batch", methods=["POST"])
+def extract_batch():
+    stream = request.stream
+
+    def generate():
+        for line_number, line in iter_ndjson(stream):
+            try:
+                document = json_codec.loads(line)
+                result = sequential_chain.invoke({"json_input": document})
+                record = {"line": line_number, "status": "success", "output": result["parsed_output"]}
+            except Exception as e:
+                # Erros de um documento são reportados na linha e não interrompem o lote
+                logging.error(f"Erro ao processar a linha {line_number} do lote: {e}")
+                record = {"line": line_number, "status": "error", "message": str(e)}
+            yield json_codec.dumps(record) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+# Função para transmitir os tokens de uma etapa com LLM via SSE
+def stream_step(step_function, inputs: dict, on_output=None) -> Response:
+    """
+    Executa a etapa em uma thread e transmite cada token gerado como evento
+    SSE ``token``, seguido do resultado (``result``) ou do erro (``error``).
+    """
+    tokens = queue.Queue()
+    outcome = {}
+
+    def worker():
+        try:
+            outputs = step_function(inputs, on_token=tokens.put)
+            outcome["output"] = on_output(outputs) if on_output else {"output": {**inputs, **outputs}}
+        except Exception as e:
+            logging.error(f"Erro ao executar a etapa com streaming: {e}")
+            outcome["error"] = str(e)
+        finally:
+            tokens.put(None)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+    def generate():
+        for token in iter(tokens.get, None):
+            yield format_sse("token", {"text": token})
+        if "error" in outcome:
+            yield format_sse("error", {"status": "error", "message": outcome["error"]})
+        else:
+            yield format_sse("result", {"status": "success", **outcome["output"]})
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream")
+
+# Resultados intermediários da execução passo a passo, por run_id
+step_store = StepStore(
+    ttl=float(os.environ.get("STEP_STORE_TTL", "3600")),
+    max_runs=int(os.environ.get("STEP_STORE_RUNS", "1000")),
+    max_bytes=int(os.environ.get("STEP_STORE_BYTES", str(64 * 1024 * 1024))),
+)
+
+# Etapas executáveis individualmente, na ordem do workflow: (chain, função com streaming)
+run_steps = {
+    "generate_mapping": (generate_mapping_chain, generate_mapping),
+    "extract_data": (extract_chain, None),
+    "json_to_string": (json_to_string_chain, None),
+    "generate_output": (generate_output_chain, generate_output),
+    "parse_output": (parse_output_chain, None),
+}
+
 # Rota para executar uma etapa específica
 @app.route("/run_step", methods=["POST"])
 def run_step():
     data = request.json
     step = data.get("step")
+    stream = data.get("stream", False)
 
+    if step not in run_steps:
+        return jsonify({"status": "error", "message": "Etapa inválida."})
+
+    # A primeira etapa inicia uma nova execução; as demais continuam a indicada
+    if step == "generate_mapping" and not data.get("run_id"):
+        run_id = step_store.create({"json_input": original_json})
+    else:
+        run_id = data.get("run_id")
     try:
-        if step == "generate_mapping":
-            result = generate_mapping_chain.invoke({"json_input": original_json})
-        elif step == "extract_data":
-            result = extract_chain.invoke({"json_input": original_json, "mapping": result["mapping"]})
-        elif step == "json_to_string":
-            result = json_to_string_chain.invoke({"extracted_data": result["extracted_data"]})
-        elif step == "generate_output":
-            result = generate_output_chain.invoke({"json_string": result["json_string"]})
-        elif step == "parse_output":
-            result = parse_output_chain.invoke({"model_output": result["model_output"]})
-        else:
-            return jsonify({"status": "error", "message": "Etapa inválida."})
+        values = step_store.get(run_id)
+    except RunNotFound:
+        return jsonify({"status": "error", "message": "Execução não encontrada ou expirada."}), 404
+
+    chain, step_function = run_steps[step]
+    missing = [key for key in chain.input_keys if key not in values]
+    if missing:
+        return jsonify({"status": "error", "message": f"Execute as etapas anteriores antes desta (faltam: {', '.join(missing)})."})
+    inputs = {key: values[key] for key in chain.input_keys}
 
-        return jsonify({"status": "success", "output": result})
+    # Reexecutar uma etapa invalida as saídas das etapas seguintes
+    later_steps = list(run_steps)[list(run_steps).index(step) + 1:]
+    stale_keys = [key for name in later_steps for key in run_steps[name][0].output_keys]
+
+    def save(outputs):
+        step_store.update(run_id, outputs, discard=stale_keys)
+        return {"run_id": run_id, "output": {**inputs, **outputs}}
+
+    try:
+        if stream and step_function is not None:
+            return stream_step(step_function, inputs, on_output=save)
+        result = save(chain.invoke(inputs, return_only_outputs=True))
+        return jsonify({"status": "success", **result})
     except Exception as e:
         logging.error(f"Erro ao executar a etapa {step}: {e}")
         return jsonify({"status": "error", "message": str(e)})
 
+def is_reloader_parent():
+    """
+    Com o reloader (``app.run(debug=True)`` ou ``flask run --debug``), o app é
+    importado também pelo processo pai, que apenas observa os arquivos e
+    reexecuta o servidor num processo filho (WERKZEUG_RUN_MAIN=true).
+    """
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        return False
+    if __name__ == "__main__":
+        return True  # app.run(debug=True) abaixo
+    if os.environ.get("FLASK_RUN_FROM_CLI") == "true":
+        import click
+        from flask.helpers import get_debug_flag
+
+        # ``flask run`` carrega o app antes de decidir se usa o reloader
+        context = click.get_current_context(silent=True)
+        if context is not None and context.command.name == "run":
+            reload = context.params.get("reload")
+            return get_debug_flag() if reload is None else reload
+    return False
+
+# Só o processo que atende as requisições aquece o modelo
+if MODEL_WARMUP and not is_reloader_parent():
+    start_warmup()
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
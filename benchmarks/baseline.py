@@ -0,0 +1,69 @@
+"""
+Cópia congelada do ``extract_data`` original de app.py (antes do motor
+compilado de ``mapping_engine``), usada como referência nos benchmarks para
+medir o ganho do motor compilado. Não deve ser alterada.
+"""
+
+
+def extract_data(data, mapping):
+    """
+    Extrai dados dinamicamente de um JSON usando um mapeamento.
+    """
+    output = {}
+
+    for key, value in mapping.items():
+        if isinstance(value, dict):
+            # Tratar mapeamentos para valores simples
+            path = value.get("path", [])
+            default = value.get("default", None)
+            current_data = data
+
+            # Percorrer o caminho no JSON
+            for step in path:
+                if isinstance(current_data, list):
+                    # Se o caminho aponta para uma lista, iterar sobre os itens
+                    current_data = [item.get(step, {}) for item in current_data]
+                else:
+                    # Se o caminho aponta para um objeto, acessar diretamente
+                    current_data = current_data.get(step, {})
+
+                # Se o valor for None, interromper o loop
+                if current_data is None:
+                    break
+
+            # Se o caminho resultou em uma lista, pegar o primeiro item
+            if isinstance(current_data, list) and current_data:
+                current_data = current_data[0]
+
+            # Adicionar o valor ao JSON de saída
+            output[key] = current_data if current_data is not None else default
+
+        elif isinstance(value, list):
+            # Tratar mapeamentos para listas de objetos
+            path = value[0].get("path", [])
+            current_data = data
+
+            # Percorrer o caminho no JSON
+            for step in path:
+                if isinstance(current_data, list):
+                    # Se o caminho aponta para uma lista, iterar sobre os itens
+                    current_data = [item.get(step, {}) for item in current_data]
+                else:
+                    # Se o caminho aponta para um objeto, acessar diretamente
+                    current_data = current_data.get(step, {})
+
+                # Se o valor for None, interromper o loop
+                if current_data is None:
+                    break
+
+            # Extrair os itens da lista
+            output[key] = []
+            for item in current_data:
+                extracted_item = {}
+                for sub_key, sub_value in value[0].items():
+                    if sub_key == "path":
+                        continue
+                    extracted_item[sub_key] = item.get(sub_value, None)
+                output[key].append(extracted_item)
+
+    return output
@@ -0,0 +1,282 @@
+"""
+Microbenchmarks dos trechos em Python puro do workflow.
+
+Mede vazão (melhor de N repetições) e pico de memória (tracemalloc) da
+extração (o ``extract_data`` original de app.py como referência,
+``extract_data``, ``compile_mapping``, ``extract_columnar`` e
+``extract_stream``), da extração do JSON da saída do modelo
+(``parse_json_output`` e o parser incremental alimentado em trechos), da
+serialização de ``transform_json_to_string`` e do ``output_parser.parse``,
+sobre documentos sintéticos de tamanho crescente.
+
+Roda offline: nenhuma etapa carrega modelo. Uso:
+
+    python benchmarks/bench_hot_paths.py --sizes 10 1000 100000 --output results.json
+    python benchmarks/bench_hot_paths.py --compare results.json --threshold 0.10
+"""
+from pathlib import Path
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from baseline import extract_data as baseline_extract_data  # noqa: E402
+from synthetic import make_document, make_mapping, make_model_output  # noqa: E402
+from mapping_engine import compile_mapping, extract_columnar, extract_data  # noqa: E402
+from json_stream import IncrementalJsonParser, parse_json_output  # noqa: E402
+from streaming_extract import extract_stream  # noqa: E402
+
+# Tamanho dos trechos entregues ao parser incremental (aprox. um token)
+STREAM_CHUNK = 4
+
+# O parse_partial_json do LangChain, usado por output_parser.parse, é
+# quadrático no tamanho da saída (1000 itens já levam minutos)
+OUTPUT_PARSER_MAX_ORDERS = 100
+
+
+class Skip(Exception):
+    """
+    O benchmark não pode rodar neste ambiente (por exemplo, dependência ausente).
+    """
+
+
+def _app():
+    # app.py depende de Flask e LangChain, mas não carrega modelo ao ser importado
+    try:
+        import app
+    except ImportError as error:
+        raise Skip(f"app.py indisponível: {error}")
+    return app
+
+
+# Cada benchmark recebe o caso sintético e devolve (função medida, unidades por chamada, unidade)
+def bench_baseline_extract(case):
+    # Referência: o laço interpretado original, antes do motor compilado
+    document, mapping = case["document"], case["mapping"]
+    return (lambda: baseline_extract_data(document, mapping)), case["orders"], "rows"
+
+
+def bench_extract_data(case):
+    document, mapping = case["document"], case["mapping"]
+    return (lambda: extract_data(document, mapping)), case["orders"], "rows"
+
+
+def bench_compiled_extract(case):
+    document = case["document"]
+    extract = compile_mapping(case["mapping"]).extract
+    return (lambda: extract(document)), case["orders"], "rows"
+
+
+def bench_columnar_extract(case):
+    document, mapping = case["document"], case["mapping"]
+    return (lambda: extract_columnar(document, mapping)), case["orders"], "rows"
+
+
+def bench_stream_extract(case):
+    # Extração direto dos bytes do documento, sem decodificá-lo por inteiro
+    text = json.dumps(case["document"]).encode()
+    mapping = case["mapping"]
+    return (lambda: extract_stream(text, mapping)), len(text), "bytes"
+
+
+def bench_parse_json_output(case):
+    text = case["model_output"]
+    return (lambda: parse_json_output(text)), len(text), "bytes"
+
+
+def bench_incremental_parser(case):
+    text = case["model_output"]
+    chunks = [text[index:index + STREAM_CHUNK] for index in range(0, len(text), STREAM_CHUNK)]
+
+    def run():
+        parser = IncrementalJsonParser()
+        for chunk in chunks:
+            if parser.feed(chunk):
+                break
+        return parser.value
+
+    return run, len(text), "bytes"
+
+
+def bench_json_to_string(case):
+    transform = _app().transform_json_to_string
+    inputs = {"extracted_data": case["extracted_data"]}
+    return (lambda: transform(inputs)), case["orders"], "rows"
+
+
+def bench_output_parser(case):
+    if case["orders"] > OUTPUT_PARSER_MAX_ORDERS:
+        raise Skip(f"limitado a {OUTPUT_PARSER_MAX_ORDERS} itens (parse quadrático no LangChain)")
+    parse = _app().output_parser.parse
+    text = case["model_output"]
+    return (lambda: parse(text)), len(text), "bytes"
+
+
+BENCHMARKS = {
+    "baseline_extract": bench_baseline_extract,
+    "extract_data": bench_extract_data,
+    "compiled_extract": bench_compiled_extract,
+    "columnar_extract": bench_columnar_extract,
+    "stream_extract": bench_stream_extract,
+    "parse_json_output": bench_parse_json_output,
+    "incremental_parser": bench_incremental_parser,
+    "json_to_string": bench_json_to_string,
+    "output_parser": bench_output_parser,
+}
+
+
+def make_case(orders, depth, keys):
+    """
+    Documento, mapeamento e saídas derivadas para um tamanho de lista.
+    """
+    document = make_document(orders=orders, depth=depth, keys=keys)
+    mapping = make_mapping(depth=depth)
+    extracted_data = extract_data(document, mapping)
+    return {
+        "orders": orders,
+        "document": document,
+        "mapping": mapping,
+        "extracted_data": extracted_data,
+        "model_output": make_model_output(extracted_data),
+    }
+
+
+def measure_time(function, repeat, min_time):
+    """
+    Melhor tempo por chamada, com o número de chamadas por repetição
+    calibrado para durar pelo menos ``min_time`` segundos.
+    """
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+
+    best = elapsed / loops
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        best = min(best, (time.perf_counter() - start) / loops)
+    return best, loops
+
+
+def measure_memory(function):
+    """
+    Pico de memória alocada durante uma chamada, em bytes.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        function()
+        return tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+
+def run(names, sizes, depth, keys, repeat, min_time):
+    results = []
+    for orders in sizes:
+        case = make_case(orders, depth, keys)
+        for name in names:
+            try:
+                function, units, unit = BENCHMARKS[name](case)
+            except Skip as error:
+                print(f"{name:<20} orders={orders:<9} ignorado: {error}")
+                continue
+            seconds, loops = measure_time(function, repeat, min_time)
+            peak_bytes = measure_memory(function)
+            result = {
+                "name": name,
+                "orders": orders,
+                "depth": depth,
+                "keys": keys,
+                "seconds": seconds,
+                "loops": loops,
+                "throughput": units / seconds if seconds else None,
+                "unit": f"{unit}/s",
+                "peak_bytes": peak_bytes,
+            }
+            results.append(result)
+            print(
+                f"{name:<20} orders={orders:<9} {seconds * 1000:>11.3f} ms"
+                f" {result['throughput']:>14,.0f} {result['unit']:<8} pico {peak_bytes / 1024:>12,.1f} KiB"
+            )
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    """
+    Compara com um arquivo de resultados anterior. Retorna as regressões
+    (tempo ou pico de memória acima de ``1 + threshold`` vezes o anterior).
+    """
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = {
+            (item["name"], item["orders"], item["depth"], item["keys"]): item
+            for item in json.load(file)["results"]
+        }
+
+    regressions = []
+    print(f"\nComparação com {baseline_path} (limite +{threshold:.0%})")
+    for result in results:
+        previous = baseline.get((result["name"], result["orders"], result["depth"], result["keys"]))
+        if previous is None:
+            continue
+        time_ratio = result["seconds"] / previous["seconds"]
+        memory_ratio = result["peak_bytes"] / previous["peak_bytes"] if previous["peak_bytes"] else 1.0
+        regressed = time_ratio > 1 + threshold or memory_ratio > 1 + threshold
+        if regressed:
+            regressions.append(result)
+        print(
+            f"{result['name']:<20} orders={result['orders']:<9} tempo x{time_ratio:.2f}"
+            f" memória x{memory_ratio:.2f}{'  REGRESSÃO' if regressed else ''}"
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10, 1_000, 100_000],
+                        help="tamanhos da lista orders (até 1000000)")
+    parser.add_argument("--depth", type=int, default=2, help="profundidade do ramo aninhado extra")
+    parser.add_argument("--keys", type=int, default=4, help="chaves por nível do ramo aninhado extra")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="duração mínima de cada repetição (s)")
+    parser.add_argument("--output", help="arquivo JSON onde gravar os resultados")
+    parser.add_argument("--compare", help="arquivo JSON de resultados anteriores")
+    parser.add_argument("--threshold", type=float, default=0.10, help="regressão tolerada (fração)")
+    args = parser.parse_args(argv)
+
+    results = run(args.only, args.sizes, args.depth, args.keys, args.repeat, args.min_time)
+
+    if args.output:
+        report = {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"\nResultados gravados em {args.output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
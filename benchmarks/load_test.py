@@ -0,0 +1,252 @@
+"""
+Gerador de carga HTTP para o app.py.
+
+Dispara requisições concorrentes com uma mistura configurável de rotas e
+reporta latência (p50/p95/p99), vazão e taxa de erro por rota. Para medir a
+camada HTTP sem o modelo, suba o app com a LLM falsa e sem os caches de
+respostas e de mapeamentos: as rotas usam sempre o mesmo documento, então
+depois da primeira requisição só se mediriam acertos dos caches (o teste se
+recusa a rodar sem ``--allow-llm-cache``/``--allow-mapping-cache``):
+
+    LLM_BACKEND=fake LLM_CACHE=0 MAPPING_CACHE_SIZE=0 FAKE_LLM_LATENCY=0.2 FAKE_LLM_TOKENS_PER_SECOND=40 flask --app app run
+    python benchmarks/load_test.py --concurrency 8 --duration 30 --mix start=1,run_step=3
+"""
+from collections import defaultdict
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def _post(url, body, content_type="application/json", timeout=300):
+    request = urllib.request.Request(url, data=body, method="POST", headers={"Content-Type": content_type})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.status, response.read()
+
+
+def _json_ok(payload):
+    # As rotas respondem 200 com {"status": "error"} em caso de falha
+    return json.loads(payload).get("status") != "error"
+
+
+def request_start(base_url, args):
+    status, payload = _post(f"{base_url}/start", b"{}")
+    return _json_ok(payload)
+
+
+def request_run_step(base_url, args):
+    body = json.dumps({"step": args.step, "stream": args.stream}).encode()
+    status, payload = _post(f"{base_url}/run_step", body)
+    if args.stream:
+        return b"event: result" in payload
+    return _json_ok(payload)
+
+
+def request_batch(base_url, args):
+    document = json.dumps({"data": {"user_info": {"user_id": 1, "user_name": "Load Test"}, "orders": []}})
+    body = "\n".join([document] * args.batch_size).encode()
+    status, payload = _post(f"{base_url}/extract/batch", body, "application/x-ndjson")
+    lines = [json.loads(line) for line in payload.splitlines() if line.strip()]
+    return len(lines) == args.batch_size and all(line["status"] == "success" for line in lines)
+
+
+REQUESTS = {
+    "start": request_start,
+    "run_step": request_run_step,
+    "batch": request_batch,
+}
+
+
+def parse_mix(text):
+    """
+    ``"start=1,run_step=3"`` -> lista de (rota, peso).
+    """
+    mix = []
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name not in REQUESTS:
+            raise argparse.ArgumentTypeError(f"Rota desconhecida: {name} (opções: {', '.join(REQUESTS)})")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    """
+    Percentil pelo método do posto mais próximo.
+    """
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class LoadTest:
+    """
+    Workers em threads, cada um com uma conexão por requisição (urllib).
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.names = [name for name, _ in args.mix]
+        self.weights = [weight for _, weight in args.mix]
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = {}
+        self._lock = threading.Lock()
+        self._issued = 0
+        self._deadline = None
+
+    def _next(self):
+        # Reserva a próxima requisição, respeitando --requests ou --duration
+        with self._lock:
+            if self.args.requests and self._issued >= self.args.requests:
+                return False
+            if self._deadline and time.perf_counter() >= self._deadline:
+                return False
+            self._issued += 1
+            return True
+
+    def worker(self, seed):
+        rng = random.Random(seed)
+        while self._next():
+            name = rng.choices(self.names, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                ok = REQUESTS[name](self.args.url, self.args)
+                error = None if ok else "resposta com status de erro"
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                ok, error = False, str(e)
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.latencies[name].append(elapsed)
+                if not ok:
+                    self.errors[name] += 1
+                    self.error_samples.setdefault(name, error)
+
+    def run(self):
+        start = time.perf_counter()
+        if self.args.duration:
+            self._deadline = start + self.args.duration
+        threads = [threading.Thread(target=self.worker, args=(seed,)) for seed in range(self.args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(time.perf_counter() - start)
+
+    def report(self, wall_time):
+        routes = {}
+        for name in sorted(self.latencies):
+            values = sorted(self.latencies[name])
+            routes[name] = self._summary(values, self.errors[name], wall_time)
+            if name in self.error_samples:
+                routes[name]["first_error"] = self.error_samples[name]
+        everything = sorted(value for values in self.latencies.values() for value in values)
+        return {
+            "url": self.args.url,
+            "concurrency": self.args.concurrency,
+            "wall_time": wall_time,
+            "total": self._summary(everything, sum(self.errors.values()), wall_time),
+            "routes": routes,
+        }
+
+    @staticmethod
+    def _summary(values, errors, wall_time):
+        return {
+            "requests": len(values),
+            "errors": errors,
+            "error_rate": errors / len(values) if values else 0.0,
+            "throughput": len(values) / wall_time if wall_time else 0.0,
+            "mean": sum(values) / len(values) if values else None,
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+            "max": values[-1] if values else None,
+        }
+
+
+def server_caches(base_url):
+    """
+    Caches ativos no app, como informados pelo /readyz (``llm_cache`` e
+    ``mapping_cache``; ausentes se o app não informar).
+    """
+    request = urllib.request.Request(f"{base_url}/readyz")
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            payload = response.read()
+    except urllib.error.HTTPError as e:
+        payload = e.read()  # 503 enquanto o modelo aquece
+    readiness = json.loads(payload)
+    return {name: readiness.get(name) for name in ("llm_cache", "mapping_cache")}
+
+
+# Cache -> (opção que permite medir com ele ativo, variável que o desativa)
+CACHE_GUARDS = {
+    "llm_cache": ("allow_llm_cache", "LLM_CACHE=0"),
+    "mapping_cache": ("allow_mapping_cache", "MAPPING_CACHE_SIZE=0"),
+}
+
+
+def print_report(report):
+    def ms(value):
+        return f"{value * 1000:9.1f}" if value is not None else "        -"
+
+    print(f"{report['url']}  concorrência={report['concurrency']}  duração={report['wall_time']:.1f}s")
+    print(f"{'rota':<10} {'reqs':>6} {'erros':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, summary in [*report["routes"].items(), ("total", report["total"])]:
+        print(
+            f"{name:<10} {summary['requests']:>6} {summary['errors']:>6} {summary['throughput']:>8.2f}"
+            f" {ms(summary['p50'])} {ms(summary['p95'])} {ms(summary['p99'])} {ms(summary['max'])}"
+        )
+    for name, summary in report["routes"].items():
+        if "first_error" in summary:
+            print(f"primeiro erro em {name}: {summary['first_error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--duration", type=float, help="duração do teste em segundos")
+    parser.add_argument("--requests", type=int, help="total de requisições (padrão: 100 se --duration não for dado)")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("start=1,run_step=1"),
+                        help="rotas e pesos, ex.: start=1,run_step=3,batch=1")
+    parser.add_argument("--step", default="generate_mapping", help="etapa enviada ao /run_step")
+    parser.add_argument("--stream", action="store_true", help="usar o /run_step com streaming SSE")
+    parser.add_argument("--batch-size", type=int, default=10, help="documentos por requisição ao /extract/batch")
+    parser.add_argument("--output", help="arquivo JSON onde gravar o relatório")
+    parser.add_argument("--allow-llm-cache", action="store_true",
+                        help="medir mesmo com o cache de respostas das LLMs ativo no app")
+    parser.add_argument("--allow-mapping-cache", action="store_true",
+                        help="medir mesmo com o cache de mapeamentos ativo no app")
+    args = parser.parse_args(argv)
+    if not args.duration and not args.requests:
+        args.requests = 100
+    args.url = args.url.rstrip("/")
+
+    caches = server_caches(args.url)
+    for name, (allow, disable) in CACHE_GUARDS.items():
+        if caches[name] and not getattr(args, allow):
+            option = "--" + allow.replace("_", "-")
+            print(f"O {name} está ativo no app: depois da primeira requisição o teste mediria acertos do cache. "
+                  f"Suba o app com {disable} ou use {option}.", file=sys.stderr)
+            return 2
+    print("  ".join(
+        f"{name}: {'ativo' if enabled else 'desativado' if enabled is not None else 'desconhecido'}"
+        for name, enabled in caches.items()
+    ))
+
+    report = LoadTest(args).run()
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    return 1 if report["total"]["requests"] and report["total"]["errors"] == report["total"]["requests"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
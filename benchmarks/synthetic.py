@@ -0,0 +1,70 @@
+"""
+Geradores de documentos sintéticos para os benchmarks.
+
+Os documentos seguem a forma do ``original_json`` de app.py e escalam em três
+dimensões: tamanho da lista ``orders``, profundidade de aninhamento e
+quantidade de chaves por objeto.
+"""
+import json
+import random
+
+PRODUCTS = ["Laptop", "Phone", "Tablet", "Monitor", "Keyboard", "Mouse", "Headset", "Camera"]
+
+
+def _nested(depth, keys, string_length):
+    # Objeto com ``keys`` chaves por nível e ``depth`` níveis
+    if depth == 0:
+        return "x" * string_length
+    return {f"key_{index}": _nested(depth - 1, keys, string_length) for index in range(keys)}
+
+
+def make_document(orders=10, depth=2, keys=4, string_length=16, seed=0):
+    """
+    Documento com ``orders`` itens e um ramo extra de ``depth`` níveis com
+    ``keys`` chaves cada.
+    """
+    rng = random.Random(seed)
+    return {
+        "data": {
+            "user_info": {"user_id": rng.randint(1, 10**6), "user_name": "John Doe"},
+            "location": {"city": "New York", "zip": "10001"},
+            "orders": [
+                {"order_id": index, "product": rng.choice(PRODUCTS), "price": rng.randint(10, 3000)}
+                for index in range(orders)
+            ],
+            "extra": _nested(depth, keys, string_length),
+        }
+    }
+
+
+def make_mapping(depth=2):
+    """
+    Mapeamento do documento sintético, incluindo um caminho até a folha mais
+    profunda do ramo extra.
+    """
+    return {
+        "user_id": {"path": ["data", "user_info", "user_id"]},
+        "user_name": {"path": ["data", "user_info", "user_name"]},
+        "user_city": {"path": ["data", "location", "city"]},
+        "deep_value": {"path": ["data", "extra"] + ["key_0"] * depth},
+        "orders": [
+            {
+                "path": ["data", "orders"],
+                "order_id": "order_id",
+                "product_name": "product",
+                "product_price": "price",
+            }
+        ],
+    }
+
+
+def make_model_output(extracted_data):
+    """
+    Saída típica do modelo: texto introdutório, bloco de código com o JSON e
+    texto depois do JSON.
+    """
+    return (
+        "Sure! Here is the information extracted from the JSON:\n\n```json\n"
+        + json.dumps(extracted_data, indent=4)
+        + "\n```\n\nLet me know if you need anything else."
+    )
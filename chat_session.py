@@ -0,0 +1,205 @@
+"""
+Sessão de conversa com histórico, com as respostas entregues token a token.
+
+Com LlamaCpp, o histórico é guardado como os próprios tokens avaliados pelo
+modelo. A cada turno o llama.cpp compara o novo prompt com os tokens que já
+estão no KV-cache e avalia apenas a pergunta nova, de modo que o tempo até o
+primeiro token não cresce com o tamanho da conversa. Quando o histórico não
+cabe em ``n_ctx``, os turnos mais antigos são descartados até o histórico
+ocupar no máximo metade do contexto: a janela restante é reavaliada uma única
+vez e os turnos seguintes voltam a avaliar só a pergunta.
+
+Outros backends (OpenAI, FakeLLM) recebem a transcrição como texto, com a
+mesma janela de histórico.
+"""
+import codecs
+import time
+
+# Formato de cada turno, o mesmo do prompt original de hello_langchain.py
+TURN_TEMPLATE = "\nQuestion: {question}\n\nAnswer:"
+TURN_SEPARATOR = "\n"
+STOP = ["\nQuestion:"]
+
+
+def _held_back(text, stop):
+    # Tamanho do maior sufixo de ``text`` que pode ser o início de uma parada
+    longest = 0
+    for sequence in stop:
+        for size in range(min(len(sequence) - 1, len(text)), longest, -1):
+            if text.endswith(sequence[:size]):
+                longest = size
+                break
+    return longest
+
+
+class ChatSession:
+    """
+    Conversa com ``llm`` (uma LLM do LangChain) que lembra os turnos
+    anteriores. ``context_tokens`` limita o histórico dos backends sem
+    ``n_ctx`` próprio.
+    """
+
+    def __init__(self, llm, system: str = "", stop=STOP, max_tokens=None, context_tokens=4096):
+        self.llm = llm
+        self.system = system
+        self.stop = list(stop)
+        client = getattr(llm, "client", None)
+        # Backend llama.cpp: geração token a token sobre o KV-cache do modelo
+        self.client = client if hasattr(client, "generate") and hasattr(client, "tokenize") else None
+        self.max_tokens = max_tokens or getattr(llm, "max_tokens", None) or 256
+        self.n_ctx = self.client.n_ctx() if self.client is not None else context_tokens
+        self.turns = []  # (pergunta, resposta, tamanho em tokens, tokens no llama.cpp)
+        self.last_turn = {}
+        self._prefix = self._encode(system, add_bos=True) if self.client is not None else []
+        self._prefix_size = len(self._prefix) if self.client is not None else self._count(system)
+        self._evaluated = []  # tokens que estão no KV-cache do modelo
+
+    def reset(self):
+        """
+        Esquece a conversa (o KV-cache é reaproveitado até o fim do prefixo).
+        """
+        self.turns = []
+
+    def ask(self, question: str, on_token=None) -> str:
+        """
+        Responde à pergunta considerando o histórico, repassando cada trecho
+        gerado para ``on_token``.
+        """
+        if self.client is not None:
+            return self._ask_llama(question, on_token)
+        return self._ask_text(question, on_token)
+
+    def add_turn(self, question: str, answer: str):
+        """
+        Acrescenta ao histórico um turno respondido fora do modelo (por
+        exemplo, pelo cache semântico); ele é avaliado junto com a próxima
+        pergunta.
+        """
+        if self.client is not None:
+            tokens = self._encode(TURN_TEMPLATE.format(question=question) + " " + answer + TURN_SEPARATOR)
+            self._fit(len(tokens))
+            self.turns.append((question, answer, len(tokens), tokens))
+        else:
+            size = self._count(TURN_TEMPLATE.format(question=question) + " " + answer + TURN_SEPARATOR)
+            self._fit(size)
+            self.turns.append((question, answer, size, None))
+
+    def _encode(self, text, add_bos=False):
+        return self.client.tokenize(text.encode("utf-8"), add_bos=add_bos) if text or add_bos else []
+
+    def _count(self, text):
+        return self.llm.get_num_tokens(text) if text else 0
+
+    def _fit(self, needed):
+        # Janela do histórico: ao estourar o contexto, descartar os turnos mais
+        # antigos até sobrar no máximo metade de n_ctx
+        used = self._prefix_size + sum(turn[2] for turn in self.turns)
+        if used + needed <= self.n_ctx:
+            return
+        while self.turns and used + needed > self.n_ctx // 2:
+            used -= self.turns.pop(0)[2]
+        if used + needed > self.n_ctx:
+            raise ValueError(f"A pergunta não cabe no contexto do modelo ({used + needed} > {self.n_ctx} tokens).")
+
+    def _ask_llama(self, question, on_token):
+        client = self.client
+        question_tokens = self._encode(TURN_TEMPLATE.format(question=question))
+        self._fit(len(question_tokens) + self.max_tokens)
+
+        history = list(self._prefix)
+        for turn in self.turns:
+            history.extend(turn[3])
+        prompt_tokens = history + question_tokens
+
+        # O llama.cpp reaproveita o maior prefixo em comum com o KV-cache
+        reused = 0
+        for evaluated, token in zip(self._evaluated, prompt_tokens):
+            if evaluated != token:
+                break
+            reused += 1
+
+        started = time.perf_counter()
+        first_token = None
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        generated, ends = [], []
+        answer, emitted = "", 0
+        eos = client.token_eos()
+        stopped = False
+        for token in client.generate(
+            prompt_tokens,
+            temp=getattr(self.llm, "temperature", 0.8) or 0.0,
+            top_p=getattr(self.llm, "top_p", 0.95) or 0.95,
+            top_k=getattr(self.llm, "top_k", 40) or 40,
+            repeat_penalty=getattr(self.llm, "repeat_penalty", 1.1) or 1.1,
+            reset=True,
+        ):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            if token == eos or len(generated) >= self.max_tokens:
+                break
+            generated.append(token)
+            start = len(answer)
+            answer += decoder.decode(client.detokenize([token]))
+            ends.append(len(answer))
+
+            # Procurar as paradas apenas perto do texto novo
+            found = (answer.find(sequence, max(0, start - len(sequence))) for sequence in self.stop)
+            cut = min((index for index in found if index >= 0), default=-1)
+            if cut >= 0:
+                answer = answer[:cut]
+                stopped = True
+                break
+            # Só repassar o texto que não pode ser o início de uma parada
+            visible = len(answer) - _held_back(answer, self.stop)
+            if on_token is not None and visible > emitted:
+                on_token(answer[emitted:visible])
+            emitted = max(emitted, visible)
+
+        if on_token is not None and len(answer) > emitted:
+            on_token(answer[emitted:])
+
+        # Tokens já avaliados pelo modelo: o prompt e os gerados (o último só é
+        # avaliado quando o próximo é pedido, o que não acontece numa parada)
+        kept = [token for token, end in zip(generated, ends) if end <= len(answer)]
+        self._evaluated = prompt_tokens + (generated[:-1] if stopped else generated)
+        turn_tokens = question_tokens + kept + self._encode(TURN_SEPARATOR)
+        self.turns.append((question, answer, len(turn_tokens), turn_tokens))
+        self.last_turn = {
+            "prompt_tokens": len(prompt_tokens),
+            "evaluated_tokens": len(prompt_tokens) - reused,
+            "generated_tokens": len(generated),
+            "time_to_first_token": first_token,
+            "seconds": time.perf_counter() - started,
+        }
+        return answer.strip()
+
+    def _ask_text(self, question, on_token):
+        turn = TURN_TEMPLATE.format(question=question)
+        self._fit(self._count(turn) + self.max_tokens)
+        prompt = self.system + "".join(
+            TURN_TEMPLATE.format(question=previous) + " " + answer + TURN_SEPARATOR
+            for previous, answer, _, _ in self.turns
+        ) + turn
+
+        started = time.perf_counter()
+        first_token = None
+        parts = []
+        for chunk in self.llm.stream(prompt, stop=self.stop):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            text = getattr(chunk, "content", chunk)  # chat models entregam mensagens
+            parts.append(text)
+            if on_token is not None:
+                on_token(text)
+
+        answer = "".join(parts).strip()
+        size = self._count(turn + " " + answer + TURN_SEPARATOR)
+        self.turns.append((question, answer, size, None))
+        self.last_turn = {
+            "prompt_tokens": self._count(prompt),
+            "evaluated_tokens": None,
+            "generated_tokens": self._count(answer),
+            "time_to_first_token": first_token,
+            "seconds": time.perf_counter() - started,
+        }
+        return answer
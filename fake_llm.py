@@ -0,0 +1,236 @@
+"""
+LLM determinística para testes de carga e desenvolvimento sem modelo.
+
+Simula a latência de avaliação do prompt e a velocidade de decodificação de
+um modelo local e responde com textos fixos: o mapeamento de exemplo para o
+prompt de mapeamento e um objeto com as chaves das format instructions para
+os prompts de extração. Ativada com ``LLM_BACKEND=fake`` no registro de
+modelos, que também troca o modelo de embeddings por ``HashingEmbeddings``.
+
+Executado como script, serve a mesma LLM por HTTP com a API da OpenAI
+(``/v1/completions`` e ``/v1/chat/completions``), para testar clientes
+OpenAI sem chave nem custo:
+
+    python fake_llm.py --port 8001 --error-rate 0.05
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator, List, Optional, Tuple
+import argparse
+import hashlib
+import itertools
+import json
+import random
+import re
+import time
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+# "Tokens": palavras, sinais de pontuação e espaços em branco
+_TOKEN = re.compile(r"\s*\w+|\s*[^\w\s]|\s+")
+
+# Chaves listadas nas format instructions do StructuredOutputParser
+_SCHEMA_KEY = re.compile(r'^\s*"([^"]+)": \w+\s+//', re.MULTILINE)
+
+# Resposta ao prompt de mapeamento (o mapeamento do exemplo de app.py)
+DEFAULT_MAPPING = {
+    "user_id": {"path": ["data", "user_info", "user_id"]},
+    "user_name": {"path": ["data", "user_info", "user_name"]},
+    "user_city": {"path": ["data", "location", "city"]},
+    "orders": [
+        {
+            "path": ["data", "orders"],
+            "order_id": "order_id",
+            "product_name": "product",
+            "product_price": "price",
+        }
+    ],
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Divide o texto nos "tokens" usados pelo streaming e pela contagem.
+    """
+    return _TOKEN.findall(text)
+
+
+class FakeLLM(LLM):
+    """
+    LLM falsa com latência configurável.
+
+    ``latency`` é o tempo até o primeiro token (avaliação do prompt) e
+    ``tokens_per_second`` a velocidade de geração (0 desativa a espera).
+    ``responses`` permite fixar respostas: pares (trecho do prompt, resposta),
+    verificados em ordem antes das respostas padrão.
+    """
+
+    latency: float = 0.0
+    tokens_per_second: float = 0.0
+    responses: List[Tuple[str, str]] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def _identifying_params(self):
+        return {"latency": self.latency, "tokens_per_second": self.tokens_per_second}
+
+    def get_num_tokens(self, text: str) -> int:
+        # Contagem local, sem baixar um tokenizer
+        return len(tokenize(text))
+
+    def respond(self, prompt: str) -> str:
+        """
+        Resposta determinística para o prompt.
+        """
+        for marker, response in self.responses:
+            if marker in prompt:
+                return response
+        if prompt.rstrip().endswith("Mapping:"):
+            return "```json\n" + json.dumps(DEFAULT_MAPPING, indent=4) + "\n```"
+        keys = _SCHEMA_KEY.findall(prompt)
+        return "```json\n" + json.dumps({key: f"fake {key}" for key in keys}, indent=4) + "\n```"
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        # Argumentos do backend real (grammar, temperature...) são ignorados
+        response = self.respond(prompt)
+        for sequence in stop or ():
+            if sequence in response:
+                response = response[:response.index(sequence)]
+
+        time.sleep(self.latency)
+        delay = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        for token in tokenize(response):
+            if delay:
+                time.sleep(delay)
+            chunk = GenerationChunk(text=token)
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Embeddings determinísticos sem modelo: cada palavra (em minúsculas) soma
+    +1 ou -1 numa posição escolhida pelo seu hash. Textos com as mesmas
+    palavras têm similaridade 1, independentemente da ordem.
+    """
+
+    def __init__(self, size: int = 256):
+        self.size = size
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        for word in re.findall(r"\w+", text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self.size] += 1.0 if digest >> 63 else -1.0
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(text) for text in texts]
+
+
+def make_openai_server(llm: FakeLLM, host="127.0.0.1", port=8001, error_rate=0.0) -> ThreadingHTTPServer:
+    """
+    Servidor HTTP compatível com a API da OpenAI respondendo com ``llm``.
+
+    Uma fração ``error_rate`` das requisições recebe 429 (com
+    ``retry-after-ms``), para exercitar os retries dos clientes.
+    """
+    ids = itertools.count(1)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # conexões keep-alive, como na API real
+
+        def log_message(self, format, *args):
+            pass  # sem uma linha de log por requisição
+
+        def send_json(self, status, body, headers=()):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            path = self.path.rstrip("/")
+            if path.endswith("/chat/completions"):
+                prompt = "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+            elif path.endswith("/completions"):
+                prompt = body.get("prompt", "")
+                prompt = prompt[0] if isinstance(prompt, list) else prompt
+            else:
+                self.send_json(404, {"error": {"message": f"Rota desconhecida: {self.path}", "type": "invalid_request_error"}})
+                return
+
+            if random.random() < error_rate:
+                error = {"message": "Rate limit reached (fake).", "type": "rate_limit_exceeded"}
+                self.send_json(429, {"error": error}, [("retry-after-ms", "100")])
+                return
+
+            text = llm.invoke(prompt, stop=body.get("stop"))
+            prompt_tokens, completion_tokens = llm.get_num_tokens(prompt), llm.get_num_tokens(text)
+            response = {
+                "id": f"fake-{next(ids)}",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }
+            if path.endswith("/chat/completions"):
+                response["object"] = "chat.completion"
+                response["choices"] = [
+                    {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+                ]
+            else:
+                response["object"] = "text_completion"
+                response["choices"] = [{"index": 0, "text": text, "logprobs": None, "finish_reason": "stop"}]
+            self.send_json(200, response)
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de testes compatível com a API da OpenAI.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.05, help="segundos até o primeiro token")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="velocidade de geração (0 sem espera)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de respostas 429")
+    args = parser.parse_args()
+
+    server = make_openai_server(
+        FakeLLM(latency=args.latency, tokens_per_second=args.tokens_per_second),
+        args.host, args.port, args.error_rate,
+    )
+    print(f"Servidor OpenAI falso em http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,115 @@
+"""
+Gramáticas GBNF (llama.cpp) geradas a partir dos ``ResponseSchema``.
+
+Com a gramática, o LlamaCpp só consegue emitir um JSON no formato esperado:
+sem texto introdutório, sem chaves faltando e sem JSON inválido.
+"""
+from functools import lru_cache
+
+# Regras JSON comuns às gramáticas
+_JSON_RULES = r'''
+ws ::= ([ \t\n] ws)?
+string ::= "\"" ([^"\\\x00-\x1f] | "\\" (["\\/bfnrt] | "u" [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F] [0-9a-fA-F]))* "\""
+integer ::= "-"? ("0" | [1-9] [0-9]*)
+number ::= integer ("." [0-9]+)? ([eE] [-+]? [0-9]+)?
+boolean ::= "true" | "false"
+null ::= "null"
+value ::= object | array | string | number | boolean | null
+object ::= "{" ws (string ws ":" ws value ws ("," ws string ws ":" ws value ws)*)? "}"
+array ::= "[" ws (value ws ("," ws value ws)*)? "]"
+'''
+
+# Regras do formato de mapeamento usado por ``extract_data``
+_MAPPING_RULES = r'''
+path ::= "[" ws (string ws ("," ws string ws)*)? "]"
+value-mapping ::= "{" ws "\"path\"" ws ":" ws path ws ("," ws "\"default\"" ws ":" ws value ws)? "}"
+list-mapping ::= "[" ws "{" ws "\"path\"" ws ":" ws path ws ("," ws string ws ":" ws string ws)* "}" ws "]"
+any-mapping ::= value-mapping | list-mapping
+'''
+
+# Tipo declarado no ResponseSchema -> regra GBNF. O tipo padrão ("string")
+# aceita qualquer valor JSON, pois os schemas deste projeto não declaram tipo
+# e mesmo assim recebem números e listas.
+_TYPE_RULES = {
+    "string": "value",
+    "str": "string",
+    "integer": "integer",
+    "int": "integer",
+    "number": "number",
+    "float": "number",
+    "boolean": "boolean",
+    "bool": "boolean",
+    "list": "array",
+    "array": "array",
+    "dict": "object",
+    "object": "object",
+}
+
+
+def _literal(text: str) -> str:
+    # Literal GBNF que reproduz a chave JSON entre aspas
+    escaped = text.replace("\\", "\\\\\\\\").replace('"', '\\\\\\"').replace("\n", "\\\\n")
+    return f'"\\"{escaped}\\""'
+
+
+def schema_type_rule(schema_type: str) -> str:
+    """
+    Regra GBNF (e tipo JSON) correspondente ao tipo declarado no schema.
+    """
+    schema_type = (schema_type or "string").strip()
+    if schema_type.lower().startswith(("list", "array")):
+        return "array"
+    return _TYPE_RULES.get(schema_type.lower(), "value")
+
+
+def _object_grammar(fields) -> str:
+    # ``fields``: pares (chave, regra do valor), na ordem do schema
+    rules = []
+    members = []
+    for index, (name, rule) in enumerate(fields):
+        rules.append(f"field-{index} ::= {_literal(name)} ws \":\" ws {rule} ws")
+        members.append(f"field-{index}")
+    body = ' "," ws '.join(members)
+    root = f'root ::= "{{" ws {body} "}}"' if members else 'root ::= "{" ws "}"'
+    return "\n".join([root, *rules])
+
+
+def response_schemas_gbnf(response_schemas) -> str:
+    """
+    Gramática do objeto de saída descrito pelos ``ResponseSchema``.
+    """
+    fields = [(schema.name, schema_type_rule(schema.type)) for schema in response_schemas]
+    return _object_grammar(fields) + _JSON_RULES
+
+
+def mapping_gbnf(response_schemas) -> str:
+    """
+    Gramática do mapeamento: uma entrada por schema, cada uma com um caminho
+    simples ou uma projeção de lista.
+    """
+    fields = []
+    for schema in response_schemas:
+        rule = schema_type_rule(schema.type)
+        if rule == "array":
+            fields.append((schema.name, "list-mapping"))
+        elif rule == "value":
+            fields.append((schema.name, "any-mapping"))
+        else:
+            fields.append((schema.name, "value-mapping"))
+    return _object_grammar(fields) + _MAPPING_RULES + _JSON_RULES
+
+
+@lru_cache(maxsize=16)
+def _llama_grammar(gbnf: str):
+    from llama_cpp import LlamaGrammar
+
+    return LlamaGrammar.from_string(gbnf, verbose=False)
+
+
+def grammar_kwargs(llm, gbnf: str) -> dict:
+    """
+    Argumentos de geração que aplicam a gramática, quando o backend é LlamaCpp.
+    """
+    if gbnf is None or not hasattr(llm, "grammar_path"):
+        return {}
+    return {"grammar": _llama_grammar(gbnf)}
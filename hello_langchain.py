@@ -1,28 +1,89 @@
-from langchain_community.llms import LlamaCpp
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-
-# Load the LlamaCpp language model, adjust GPU usage based on your hardware
-llm = LlamaCpp(
-    model_path="models/llama-2-7b-chat.Q4_K_M.gguf",
-    n_gpu_layers=40,
-    n_batch=512,  # Batch size for model processing
-    verbose=False,  # Enable detailed logging for debugging
+import argparse
+import os
+from chat_session import ChatSession
+from model_registry import EMBEDDINGS_MODEL_PATH, models
+from semantic_cache import SemanticCache
+
+parser = argparse.ArgumentParser(description="Chat with a local LLM.")
+parser.add_argument("--model", default="llama-2-7b-chat", help="model name in the shared model registry")
+parser.add_argument("--no-history", action="store_true", help="answer every question on its own")
+parser.add_argument("--stats", action="store_true", help="print time to first token and evaluated tokens per answer")
+parser.add_argument(
+    "--semantic-cache", action="store_true",
+    help="with history on, also answer similar questions from the semantic cache, keyed on the question alone "
+         "(cached answers ignore the earlier turns); it is always on with --no-history",
 )
+parser.add_argument("--no-semantic-cache", action="store_true", help="always generate a new answer")
+args = parser.parse_args()
 
-# Define the prompt template with a placeholder for the question
-template = """
-Question: {question}
+# Load the LlamaCpp language model once through the shared model registry
+llm = models.get(args.model)
 
-Answer:
-"""
-prompt = PromptTemplate(template=template, input_variables=["question"])
+# Chat session that keeps the conversation history (and, with LlamaCpp, the
+# model's KV cache) so each turn only evaluates the new question
+session = ChatSession(llm)
 
-# Create an LLMChain to manage interactions with the prompt and model
-llm_chain = LLMChain(prompt=prompt, llm=llm)
+# Semantic cache: a question similar to one already answered gets the stored
+# answer instead of a new generation. The cache is keyed on the question
+# alone, so by default it is only used when every question stands on its own
+# (--no-history); --semantic-cache also uses it with the history on.
+cache = None
+use_cache = args.no_history or args.semantic_cache
+if use_cache and not args.no_semantic_cache and os.environ.get("SEMANTIC_CACHE", "1") != "0":
+    embeddings = models.get("llama-embeddings")
+    cache = SemanticCache(
+        embeddings,
+        path=os.environ.get("SEMANTIC_CACHE_PATH", f"semantic_cache.{args.model}.npz"),
+        threshold=float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+        max_entries=int(os.environ.get("SEMANTIC_CACHE_ENTRIES", "1024")),
+        model=f"{args.model}:{type(embeddings).__name__}:{EMBEDDINGS_MODEL_PATH}",
+    )
 
-print("Chatbot initialized, ready to chat...")
+print("Chatbot initialized, ready to chat... (/reset clears the history)")
+if cache is None:
+    print("Semantic cache off (use --no-history, or --semantic-cache with the history on)")
+else:
+    print(f"Semantic cache on ({len(cache)} answers)")
 while True:
-    question = input("> ")
-    answer = llm_chain.run(question)
-    print(answer, '\n')
\ No newline at end of file
+    try:
+        question = input("> ")
+    except (EOFError, KeyboardInterrupt):
+        break
+    if question.strip() == "/reset":
+        session.reset()
+        continue
+    if args.no_history:
+        session.reset()
+
+    answer = cache.lookup(question) if cache is not None else None
+    if answer is not None:
+        print(answer + "\n")
+        try:
+            session.add_turn(question, answer)
+        except ValueError as e:
+            print(f"{e}\n")  # too long for the context: not kept in the history
+        if args.stats:
+            print("[answered from the semantic cache]\n")
+        continue
+
+    # Print the answer as the tokens are generated
+    try:
+        answer = session.ask(question, on_token=lambda text: print(text, end="", flush=True))
+    except ValueError as e:
+        # Questions longer than the model context are rejected before generating
+        print(f"{e}\n")
+        continue
+    print('\n')
+    if cache is not None and answer:
+        cache.update(question, answer)
+        cache.save()
+
+    if args.stats:
+        stats = session.last_turn
+        evaluated = stats['evaluated_tokens']
+        evaluated = f"{evaluated} of " if evaluated is not None else ""
+        print(
+            f"[time to first token {stats['time_to_first_token'] or 0:.2f}s, "
+            f"{evaluated}{stats['prompt_tokens']} prompt tokens evaluated, "
+            f"{stats['generated_tokens']} generated]\n"
+        )
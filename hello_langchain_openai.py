@@ -1,8 +1,8 @@
 import os
 import json
 from langchain.prompts import PromptTemplate
-from langchain.llms import OpenAI
 from langchain.chains import LLMChain
+from model_registry import models
 
 # Configurar a chave de API da OpenAI
 
@@ -51,7 +51,7 @@ prompt = PromptTemplate(
 )
 
 # Criar a LLM Chain para processamento com o LangChain
-llm = OpenAI(model="gpt-4o-mini") 
+llm = models.get("gpt-4o-mini")
 chain = LLMChain(llm=llm, prompt=prompt)
 
 # Executar a transformação
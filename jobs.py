@@ -0,0 +1,124 @@
+"""
+Execução assíncrona do workflow de extração.
+
+O envio de um job retorna imediatamente um id; um pool limitado de threads
+executa o workflow e registra o progresso de cada etapa, que pode ser
+consultado (polling) ou acompanhado como stream de eventos.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+import uuid
+
+
+class JobQueueFull(Exception):
+    """
+    Levantada quando a fila de jobs pendentes está cheia.
+    """
+
+
+class Job:
+    """
+    Estado de um job e o histórico dos seus eventos de progresso.
+    """
+
+    # Eventos que encerram o histórico de um job
+    TERMINAL_EVENTS = ("succeeded", "failed")
+
+    def __init__(self, payload):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.events = []
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in self.TERMINAL_EVENTS
+
+    def emit(self, event, **data):
+        with self._changed:
+            self.events.append({"event": event, "at": time.time(), **data})
+            self._changed.notify_all()
+
+    def wait_events(self, since, timeout=None):
+        """
+        Retorna os eventos a partir do índice ``since``, esperando por novos
+        eventos até ``timeout`` segundos se ainda não houver nenhum.
+        """
+        with self._changed:
+            if len(self.events) <= since:
+                self._changed.wait(timeout)
+            return self.events[since:]
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stages": [event["event"] for event in self.events if event["event"] not in ("running",) + self.TERMINAL_EVENTS],
+            "output": self.result,
+            "message": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """
+    Pool limitado de workers que executa ``runner(payload, report)``.
+
+    ``report(stage)`` registra o fim de uma etapa do workflow.
+    """
+
+    def __init__(self, runner, max_workers=1, max_pending=32, max_finished=256):
+        self.runner = runner
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, payload):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull("A fila de jobs está cheia, tente novamente mais tarde.")
+            self._pending += 1
+            job = Job(payload)
+            self._jobs[job.id] = job
+            self._evict()
+
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job):
+        job.status = "running"
+        job.emit("running")
+        try:
+            job.result = self.runner(job.payload, lambda stage, **data: job.emit(stage, **data))
+            job.status = "succeeded"
+        except Exception as e:
+            logging.error(f"Erro ao executar o job {job.id}: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._pending -= 1
+            job.emit(job.status)
+
+    def _evict(self):
+        # Descartar os jobs finalizados mais antigos
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[: max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
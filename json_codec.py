@@ -0,0 +1,70 @@
+"""
+Codec JSON das fronteiras do workflow (prompts da LLM e respostas HTTP).
+
+Usa o ``orjson`` quando instalado e cai para o ``json`` da biblioteca padrão
+caso contrário (ou para valores que o ``orjson`` não suporta, como inteiros
+maiores que 64 bits). Entre as etapas os valores circulam como objetos
+Python; a serialização acontece apenas aqui, em formato compacto.
+
+Floats não finitos (NaN, Infinity, -Infinity) não existem em JSON: ``dumps``
+os grava como ``null`` nos dois caminhos, como o ``orjson`` já faz, em vez
+dos literais ``NaN``/``Infinity`` do ``json`` padrão, que outros parsers
+rejeitam.
+"""
+import json
+import math
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional
+    orjson = None
+
+_COMPACT = (",", ":")
+
+
+def _finite(value):
+    # Cópia de ``value`` com os floats não finitos trocados por None
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+def dumps(value, default=None) -> str:
+    """
+    Serializa ``value`` em JSON compacto, sem escapar caracteres não ASCII
+    e com floats não finitos como ``null``.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, default=default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            pass  # tipos que o orjson não serializa: usar o json padrão
+    try:
+        return json.dumps(value, default=default, ensure_ascii=False, separators=_COMPACT, allow_nan=False)
+    except ValueError as e:
+        if "Out of range float" not in str(e):
+            raise  # referência circular, por exemplo
+        # Só então percorrer o valor trocando NaN/Infinity por null, inclusive
+        # nos valores convertidos por ``default``
+        if default is not None:
+            default = lambda item, convert=default: _finite(convert(item))
+        return json.dumps(_finite(value), default=default, ensure_ascii=False, separators=_COMPACT)
+
+
+def loads(data):
+    """
+    Decodifica JSON de ``str``, ``bytes`` ou ``bytearray``.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # Mesma mensagem (e exceção) do json padrão, que também aceita
+            # NaN/Infinity e inteiros arbitrários
+            pass
+    return json.loads(data)
+
@@ -0,0 +1,237 @@
+"""
+Recuperação de saídas da LLM que quase são um JSON válido.
+
+Em vez de falhar a requisição (e repetir todas as etapas com LLM), uma saída
+inválida passa por camadas de recuperação, cada uma com um número limitado
+de tentativas contadas em ``json_repairs_total``:
+
+1. ``local``: reparos sintáticos sem modelo (texto e cercas de código em
+   volta, vírgulas sobrando ou faltando, aspas simples, chaves sem aspas,
+   literais do Python, strings, listas e objetos não fechados);
+2. ``llm``: um prompt curto pedindo apenas a correção do JSON quebrado, em
+   vez do prompt original completo.
+"""
+import logging
+import os
+import re
+
+import json_codec
+from json_stream import JsonParseError, stream_json
+from metrics import json_repairs
+
+# Tentativas por camada: candidatos ("{") reparados localmente e novos prompts à LLM
+LOCAL_ATTEMPTS = int(os.environ.get("JSON_REPAIR_LOCAL_ATTEMPTS", "3"))
+LLM_ATTEMPTS = int(os.environ.get("JSON_REPAIR_LLM_ATTEMPTS", "1"))
+
+REPAIR_PROMPT = """Fix the following invalid or incomplete JSON. Keep the same keys and values and reply with the JSON only.
+
+Invalid JSON:
+{broken}
+
+Fixed JSON:
+"""
+
+_WORD = re.compile(r"[A-Za-z0-9_.+-]+")
+_BARE_KEY = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*(?=\s*:)")
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_LITERALS = ("true", "false", "null")
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _read_string(text, index):
+    # String com aspas duplas ou simples a partir de ``index``, devolvida
+    # como string JSON (fechada se a saída terminar antes)
+    quote = text[index]
+    parts = ['"']
+    index += 1
+    length = len(text)
+    while index < length:
+        char = text[index]
+        if char == "\\":
+            if index + 1 >= length:
+                break  # escape cortado no fim da saída
+            escaped = text[index + 1]
+            parts.append("'" if escaped == "'" else "\\" + escaped)
+            index += 2
+            continue
+        if char == quote:
+            index += 1
+            break
+        if char == '"':
+            parts.append('\\"')
+        elif char < " ":
+            parts.append(_CONTROL_ESCAPES.get(char, f"\\u{ord(char):04x}"))
+        else:
+            parts.append(char)
+        index += 1
+    parts.append('"')
+    return "".join(parts), index
+
+
+def _ends_value(tokens, stack):
+    # O último token encerra um valor (e o próximo precisa de uma vírgula)?
+    if not tokens:
+        return False
+    last = tokens[-1]
+    if last in ("}", "]"):
+        return True
+    if last in ("{", "[", ",", ":"):
+        return False
+    return stack[-1] == "]" or (len(tokens) > 1 and tokens[-2] == ":")
+
+
+def _drop_incomplete_tail(tokens, stack):
+    # Remover o que ficou pela metade no fim: vírgula, dois-pontos, chave sem
+    # valor, literal ou número cortado
+    while tokens:
+        last = tokens[-1]
+        if last in (",", ":"):
+            tokens.pop()
+        elif stack and stack[-1] == "}" and last.startswith('"') and len(tokens) > 1 and tokens[-2] in ("{", ","):
+            tokens.pop()
+        else:
+            break
+    if tokens and tokens[-1][0] not in '"{}[],:':
+        word = tokens[-1]
+        literal = next((literal for literal in _LITERALS if literal.startswith(word)), None)
+        tokens[-1] = literal or word.rstrip(".eE+-")
+
+
+def _repair_candidate(text):
+    """
+    Reescreve o valor que começa em ``text[0]`` como JSON, tolerando os
+    erros mais comuns da LLM. O texto depois do valor é ignorado.
+    """
+    tokens = []
+    stack = []
+    index = 0
+    length = len(text)
+    while index < length:
+        char = text[index]
+        if char in " \t\n\r":
+            index += 1
+            continue
+
+        if char in "}]":
+            if char in stack:
+                # Fechamento de um contêiner externo: fechar também os internos
+                if tokens and tokens[-1] == ",":
+                    tokens.pop()
+                while stack[-1] != char:
+                    tokens.append(stack.pop())
+                tokens.append(stack.pop())
+                if not stack:
+                    return "".join(tokens)
+            index += 1
+            continue
+        if char == ",":
+            if tokens and tokens[-1] not in ("{", "[", ",", ":"):
+                tokens.append(",")
+            index += 1
+            continue
+        if char == ":":
+            tokens.append(":")
+            index += 1
+            continue
+
+        # Início de um valor ou chave: inserir a vírgula esquecida
+        if stack and _ends_value(tokens, stack):
+            tokens.append(",")
+        if char in "{[":
+            tokens.append(char)
+            stack.append(_CLOSERS[char])
+            index += 1
+        elif char == '"' or char == "'":
+            token, index = _read_string(text, index)
+            tokens.append(token)
+        elif stack and stack[-1] == "}" and _BARE_KEY.match(text, index):
+            # Chave sem aspas, no estilo JavaScript
+            match = _BARE_KEY.match(text, index)
+            tokens.append(json_codec.dumps(match.group()))
+            index = match.end()
+        else:
+            match = _WORD.match(text, index)
+            if match is None:
+                index += 1  # ruído (comentários, crases, etc.)
+                continue
+            word = match.group()
+            tokens.append(_PYTHON_LITERALS.get(word, word))
+            index = match.end()
+
+    # Saída cortada: completar o que faltou
+    _drop_incomplete_tail(tokens, stack)
+    tokens.extend(reversed(stack))
+    return "".join(tokens)
+
+
+def repair_json(text: str, max_candidates: int = LOCAL_ATTEMPTS):
+    """
+    Reparo local: tenta decodificar, como objeto JSON, cada um dos primeiros
+    ``max_candidates`` trechos da saída que começam com ``{``.
+
+    Levanta ``JsonParseError`` se nenhum candidato puder ser reparado.
+    """
+    start = text.find("{")
+    for _ in range(max_candidates):
+        if start < 0:
+            break
+        try:
+            value = json_codec.loads(_repair_candidate(text[start:]))
+        except ValueError:
+            value = None
+        # Um objeto vazio não recupera nada da saída
+        if value:
+            return value
+        start = text.find("{", start + 1)
+    raise JsonParseError("A saída do modelo não pôde ser reparada localmente.")
+
+
+def stream_json_with_repair(llm, prompt: str, stage: str, on_token=None, validate=None, before_generate=None, **kwargs):
+    """
+    Gera o JSON com ``stream_json`` e, se a saída for inválida, recupera o
+    valor pelas camadas de reparo. Retorna o valor decodificado.
+
+    ``validate`` recebe cada valor reparado e o devolve (ou levanta
+    ``ValueError``, passando para a próxima tentativa), para que um reparo
+    que perdeu informação não seja aceito. A saída válida da primeira geração
+    segue sem validação, como antes. ``before_generate`` vale só para a
+    primeira geração (ver ``stream_json``).
+    """
+    validate = validate or (lambda value: value)
+    try:
+        return stream_json(llm, prompt, on_token=on_token, keep_broken=True, before_generate=before_generate, **kwargs).value
+    except JsonParseError as error:
+        broken, last_error = error.output or "", error
+
+    # Camada 1: reparo sintático local
+    try:
+        value = validate(repair_json(broken))
+        json_repairs.inc(stage=stage, tier="local", result="success")
+        logging.info(f"JSON inválido reparado localmente ({stage})")
+        return value
+    except ValueError as error:
+        json_repairs.inc(stage=stage, tier="local", result="failure")
+        last_error = error
+
+    # Camada 2: pedir à LLM só a correção do JSON quebrado
+    for attempt in range(1, LLM_ATTEMPTS + 1):
+        repair_prompt = REPAIR_PROMPT.format(broken=broken.strip())
+        logging.info(f"Prompt de reparo enviado para a LLM ({stage}, tentativa {attempt}): {repair_prompt}")
+        try:
+            try:
+                value = stream_json(llm, repair_prompt, on_token=on_token, keep_broken=True, **kwargs).value
+            except JsonParseError as error:
+                # A correção também saiu inválida: reparar localmente antes de desistir
+                broken = error.output or broken
+                value = repair_json(broken)
+            value = validate(value)
+        except ValueError as error:
+            json_repairs.inc(stage=stage, tier="llm", result="failure")
+            last_error = error
+            continue
+        json_repairs.inc(stage=stage, tier="llm", result="success")
+        logging.info(f"JSON inválido corrigido pela LLM ({stage}, tentativa {attempt})")
+        return value
+
+    raise last_error
@@ -0,0 +1,410 @@
+"""
+Extração incremental de JSON da saída do modelo.
+
+O parser consome a saída trecho a trecho (inclusive durante o streaming),
+ignora o texto e os blocos de código em volta do JSON, valida a sintaxe à
+medida que os caracteres chegam e sinaliza o fim do primeiro valor JSON
+completo ou a falha assim que a saída não puder mais se tornar válida.
+"""
+import logging
+import re
+
+from langchain_core.outputs import Generation
+
+import json_codec
+from llm_cache import cache_for, llm_string
+
+# O que o parser espera encontrar a seguir (fora de strings, números e literais)
+_VALUE, _ARRAY_FIRST, _OBJECT_FIRST, _KEY, _COLON, _AFTER_VALUE = range(6)
+
+_WHITESPACE = " \t\n\r"
+_STRING_BODY = re.compile(r'[^"\\\x00-\x1f]+')
+_NUMBER_CHARS = frozenset("+-0123456789.eE")
+_NUMBER = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?\Z")
+_HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+_LITERALS = {"t": "rue", "f": "alse", "n": "ull"}
+
+
+class JsonParseError(ValueError):
+    """
+    A saída do modelo não contém (ou não pode mais conter) um JSON válido.
+
+    ``output`` guarda a saída inválida, quando disponível, para reparo.
+    """
+
+    output = None
+
+
+class IncrementalJsonParser:
+    """
+    Parser retomável que encontra o primeiro valor JSON completo na saída.
+
+    ``openers`` define os caracteres que podem iniciar o valor procurado. Um
+    candidato que se mostra inválido logo no início (por exemplo, chaves no
+    texto introdutório) é descartado e a busca continua depois dele, até
+    ``max_candidates`` tentativas. Já um candidato que chegou a ter um par
+    chave/valor (ou um item de lista) e depois quebra faz o parser falhar
+    imediatamente.
+    """
+
+    def __init__(self, openers="{", max_candidates=3):
+        self.openers = openers
+        self.max_candidates = max_candidates
+        self.complete = False
+        self.failed = False
+        self.error = None
+        self._chunks = []
+        self._raw = ""
+        # Janela ainda necessária ao scanner; ``_offset`` é a posição de
+        # ``_window[0]`` na saída completa
+        self._window = ""
+        self._offset = 0
+        self._pos = 0
+        self._start = None
+        self._text_start = None
+        self._text_end = None
+        self._candidates = 0
+        self._value = None
+        self._parsed = False
+
+    @property
+    def raw(self) -> str:
+        """
+        Toda a saída consumida até agora.
+        """
+        if self._raw is None:
+            self._raw = "".join(self._chunks)
+        return self._raw
+
+    @property
+    def text(self) -> str:
+        """
+        Texto do valor JSON encontrado.
+        """
+        if not self.complete:
+            raise JsonParseError(self.error or "O JSON ainda não foi concluído.")
+        return self.raw[self._text_start:self._text_end]
+
+    @property
+    def value(self):
+        """
+        Valor JSON encontrado, decodificado uma única vez.
+        """
+        if not self._parsed:
+            self._value = json_codec.loads(self.text)
+            self._parsed = True
+        return self._value
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Consome um trecho da saída; retorna True quando o JSON está completo.
+
+        Levanta ``JsonParseError`` assim que a saída não puder mais ser válida.
+        """
+        if self.complete:
+            return True
+        if self.failed:
+            raise JsonParseError(self.error)
+
+        self._chunks.append(chunk)
+        self._raw = None
+        self._window += chunk
+        self._scan()
+
+        if self.failed:
+            raise JsonParseError(self.error)
+        if not self.complete:
+            self._trim()
+        return self.complete
+
+    def finish(self):
+        """
+        Sinaliza o fim da saída e retorna o valor encontrado.
+        """
+        if not self.complete and not self.failed:
+            self.failed = True
+            self.error = "A saída do modelo terminou antes do fim do JSON."
+        if self.failed:
+            raise JsonParseError(self.error)
+        return self.value
+
+    def _trim(self):
+        # Descartar da janela o que o scanner não vai mais reler, para que cada
+        # trecho custe proporcionalmente ao seu tamanho e não ao da saída toda
+        if self._start is None:
+            keep = self._pos
+        elif not self._committed:
+            keep = self._start  # o candidato ainda pode ser descartado
+        elif self._number_start is not None:
+            keep = self._number_start
+        else:
+            keep = self._pos
+        if keep <= 0:
+            return
+        self._window = self._window[keep:]
+        self._offset += keep
+        self._pos -= keep
+        if self._start is not None:
+            self._start -= keep
+            if self._number_start is not None:
+                self._number_start -= keep
+
+    def _begin(self, start):
+        self._start = start
+        self._text_start = self._offset + start
+        self._stack = [self._window[start]]
+        self._expect = _OBJECT_FIRST if self._window[start] == "{" else _ARRAY_FIRST
+        self._in_string = False
+        self._escape = False
+        self._hex = 0
+        self._literal = ""
+        self._number_start = None
+        self._committed = False
+
+    def _reject(self, index, reason):
+        # Descartar o candidato atual e procurar o próximo depois dele
+        self._candidates += 1
+        if self._committed or self._candidates >= self.max_candidates:
+            self.failed = True
+            self.error = f"A saída do modelo não é um JSON válido ({reason} na posição {index})."
+            return index
+        start = self._start
+        self._start = None
+        return start + 1
+
+    def _close(self, index):
+        self._stack.pop()
+        if not self._stack:
+            self.complete = True
+            self._text_end = self._offset + index + 1
+        else:
+            self._expect = _AFTER_VALUE
+
+    def _scan(self):
+        text = self._window
+        length = len(text)
+        i = self._pos
+
+        while i < length and not self.complete and not self.failed:
+            if self._start is None:
+                # Procurar o início do próximo candidato, ignorando o texto em volta
+                starts = [index for index in (text.find(opener, i) for opener in self.openers) if index >= 0]
+                if not starts:
+                    i = length
+                    break
+                self._begin(min(starts))
+                i = self._start + 1
+                continue
+
+            char = text[i]
+
+            if self._in_string:
+                if self._hex:
+                    if char not in _HEX_DIGITS:
+                        i = self._reject(i, "escape unicode inválido")
+                        continue
+                    self._hex -= 1
+                elif self._escape:
+                    self._escape = False
+                    if char == "u":
+                        self._hex = 4
+                    elif char not in '"\\/bfnrt':
+                        i = self._reject(i, "escape inválido")
+                        continue
+                elif char == '"':
+                    self._in_string = False
+                elif char == "\\":
+                    self._escape = True
+                else:
+                    match = _STRING_BODY.match(text, i)
+                    if match is None:
+                        i = self._reject(i, "caractere de controle em string")
+                        continue
+                    i = match.end()
+                    continue
+                i += 1
+                continue
+
+            if self._literal:
+                if char != self._literal[0]:
+                    i = self._reject(i, "literal inválido")
+                    continue
+                self._literal = self._literal[1:]
+                i += 1
+                continue
+
+            if self._number_start is not None:
+                if char in _NUMBER_CHARS:
+                    i += 1
+                    continue
+                if not _NUMBER.match(text, self._number_start, i):
+                    i = self._reject(i, "número inválido")
+                    continue
+                # O caractere que encerrou o número é processado normalmente
+                self._number_start = None
+
+            if char in _WHITESPACE:
+                i += 1
+                continue
+
+            expect = self._expect
+            if expect == _VALUE or expect == _ARRAY_FIRST:
+                if char == "]" and expect == _ARRAY_FIRST:
+                    self._close(i)
+                    i += 1
+                    continue
+                if char == "{":
+                    self._stack.append("{")
+                    self._expect = _OBJECT_FIRST
+                elif char == "[":
+                    self._stack.append("[")
+                    self._expect = _ARRAY_FIRST
+                elif char == '"':
+                    self._in_string = True
+                    self._expect = _AFTER_VALUE
+                elif char == "-" or char.isdigit():
+                    self._number_start = i
+                    self._expect = _AFTER_VALUE
+                elif char in _LITERALS:
+                    self._literal = _LITERALS[char]
+                    self._expect = _AFTER_VALUE
+                else:
+                    i = self._reject(i, "valor inesperado")
+                    continue
+                # Um valor bem formado começou: o candidato é mesmo o JSON da saída
+                self._committed = True
+            elif expect == _OBJECT_FIRST or expect == _KEY:
+                if char == '"':
+                    self._in_string = True
+                    self._expect = _COLON
+                elif char == "}" and expect == _OBJECT_FIRST:
+                    self._close(i)
+                else:
+                    i = self._reject(i, "chave esperada")
+                    continue
+            elif expect == _COLON:
+                if char != ":":
+                    i = self._reject(i, "':' esperado")
+                    continue
+                self._expect = _VALUE
+            else:
+                container = self._stack[-1]
+                if char == ",":
+                    self._expect = _KEY if container == "{" else _VALUE
+                elif (char == "}" and container == "{") or (char == "]" and container == "["):
+                    self._close(i)
+                else:
+                    i = self._reject(i, "',' ou fechamento esperado")
+                    continue
+            i += 1
+
+        self._pos = i
+
+
+def parse_json_output(output: str):
+    """
+    Retorna o primeiro objeto JSON contido em uma saída já completa.
+    """
+    parser = IncrementalJsonParser()
+    parser.feed(output)
+    return parser.finish()
+
+
+class _BracketBalance:
+    """
+    Acompanha, de forma tolerante, o fechamento de um valor inválido: conta
+    chaves e colchetes fora de strings (com aspas duplas ou simples).
+    """
+
+    def __init__(self):
+        self.depth = 0
+        self.quote = None
+        self.escape = False
+
+    def feed(self, text: str) -> bool:
+        for char in text:
+            if self.quote:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == self.quote:
+                    self.quote = None
+            elif char == '"' or char == "'":
+                self.quote = char
+            elif char == "{" or char == "[":
+                self.depth += 1
+            elif char == "}" or char == "]":
+                self.depth -= 1
+                if self.depth <= 0:
+                    return True
+        return False
+
+
+def stream_json(llm, prompt: str, on_token=None, keep_broken=False, before_generate=None, **kwargs) -> IncrementalJsonParser:
+    """
+    Gera a resposta com streaming, repassando cada token para ``on_token``.
+
+    A geração é encerrada assim que o objeto JSON de topo estiver completo, ou
+    assim que a saída não puder mais se tornar um JSON válido (neste caso
+    ``JsonParseError`` é levantada sem esperar o fim da geração). Saídas
+    válidas ficam no cache de respostas das LLMs (``llm_cache.py``). Com
+    ``keep_broken``, a geração continua após a falha até o valor inválido se
+    fechar, para que ``error.output`` tenha a saída inteira a ser reparada.
+    ``before_generate`` é chamada só quando o modelo vai de fato gerar (não
+    num acerto do cache), por exemplo para preparar o prefixo do prompt.
+    """
+    parser = IncrementalJsonParser()
+
+    # Cache de respostas: a saída de um prompt já gerado é reaproveitada inteira
+    cache = cache_for(llm)
+    if cache is not None:
+        cache_key = llm_string(llm, stream_json=True, **kwargs)
+        cached = cache.lookup(prompt, cache_key)
+        if cached:
+            if on_token is not None:
+                on_token(cached[0].text)
+            if parser.feed(cached[0].text):
+                return parser
+            parser = IncrementalJsonParser()  # entrada inválida: gerar de novo
+
+    if before_generate is not None:
+        before_generate()
+    stream = llm.stream(prompt, **kwargs)
+    try:
+        for token in stream:
+            if on_token is not None:
+                on_token(token)
+            if parser.feed(token):
+                break
+        else:
+            parser.finish()
+    except JsonParseError as e:
+        logging.error(f"Erro ao parsear JSON: {e}")
+        e.output = parser.raw
+        if keep_broken and parser._start is not None:
+            e.output += _drain_broken(parser, stream, on_token)
+        raise
+    finally:
+        # Fechar o gerador interrompe a decodificação no backend
+        stream.close()
+
+    if cache is not None:
+        cache.update(prompt, cache_key, [Generation(text=parser.raw)])
+    return parser
+
+
+def _drain_broken(parser, stream, on_token):
+    # Restante do valor inválido, lido até os colchetes abertos desde o
+    # candidato que falhou se fecharem (um "{" no texto antes dele não conta)
+    balance = _BracketBalance()
+    if balance.feed(parser.raw[parser._text_start:]):
+        return ""
+    rest = []
+    for token in stream:
+        if on_token is not None:
+            on_token(token)
+        rest.append(token)
+        if balance.feed(token):
+            break
+    return "".join(rest)
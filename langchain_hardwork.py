@@ -1,8 +1,21 @@
 from langchain.chains import TransformChain, SequentialChain
 from langchain.prompts import PromptTemplate
-from langchain.llms import OpenAI
 from langchain.output_parsers import StructuredOutputParser, ResponseSchema
+from mapping_engine import extract_data
+from mapping_cache import structural_fingerprint
+from model_registry import models, llm_cache, OPENAI_CONCURRENCY
+from json_stream import JsonParseError, parse_json_output
+from json_repair import repair_json
+from schema_validation import check_output
+from openai_batch import CompletionClient
+import json_codec
+import argparse
+import asyncio
 import json
+import logging
+import os
+import sys
+import time
 
 # Exemplo de JSON de entrada
 original_json = {
@@ -41,63 +54,9 @@ response_schemas = [
 # Configurar o JSON Output Parser
 output_parser = StructuredOutputParser.from_response_schemas(response_schemas)
 
-# Função para extrair dados dinamicamente
-def extract_data(data, mapping):
-    """
-    Extrai dados dinamicamente de um JSON usando um mapeamento.
-
-    :param data: JSON de entrada
-    :param mapping: Dicionário de mapeamento que define como os dados devem ser extraídos
-    :return: JSON transformado
-    """
-    output = {}
-
-    for key, value in mapping.items():
-        if isinstance(value, dict):
-            # Se o valor for um dicionário, significa que precisamos navegar mais fundo no JSON
-            path = value.get("path", [])
-            default = value.get("default", None)
-            current_data = data
-
-            # Percorre o caminho no JSON
-            for step in path:
-                current_data = current_data.get(step, {}) if isinstance(current_data, dict) else None
-                if current_data is None:
-                    break
-
-            # Adiciona o valor ao JSON de saída
-            output[key] = current_data if current_data is not None else default
-
-        elif isinstance(value, list):
-            # Se o valor for uma lista, significa que precisamos iterar sobre uma lista de objetos
-            path = value[0].get("path", [])
-            current_data = data
-
-            # Percorre o caminho no JSON
-            for step in path:
-                current_data = current_data.get(step, []) if isinstance(current_data, dict) else []
-
-            # Extrai os itens da lista
-            output[key] = []
-            for item in current_data:
-                extracted_item = {}
-                for sub_key, sub_value in value[0].items():
-                    if sub_key == "path":
-                        continue
-                    extracted_item[sub_key] = item.get(sub_value, None)
-                output[key].append(extracted_item)
-
-    return output
-
-
-# Etapa 1: TransformChain para gerar o mapeamento dinamicamente com base no schema
-def generate_mapping(inputs: dict) -> dict:
-    """
-    Função para gerar o mapeamento dinamicamente com base no schema.
-    """
-    # Prompt para a LLM gerar o mapeamento
-    mapping_prompt = PromptTemplate(
-        template="""
+# Prompt para a LLM gerar o mapeamento
+mapping_prompt = PromptTemplate(
+    template="""
         Given the following JSON schema and the input JSON structure, generate a mapping to extract the data.
 
         Schema:
@@ -123,20 +82,23 @@ def generate_mapping(inputs: dict) -> dict:
 
         Mapping:
         """,
-        input_variables=["schema", "json_input"]
-    )
+    input_variables=["schema", "json_input"]
+)
 
-    # Converter o schema para string
-    schema_str = json.dumps([schema.dict() for schema in response_schemas], indent=4)
+# Converter o schema para string
+schema_str = json.dumps([schema.dict() for schema in response_schemas], indent=4)
 
+# Etapa 1: TransformChain para gerar o mapeamento dinamicamente com base no schema
+def generate_mapping(inputs: dict) -> dict:
+    """
+    Função para gerar o mapeamento dinamicamente com base no schema.
+    """
     # Preencher o prompt com o schema e o JSON de entrada
     _input = mapping_prompt.format_prompt(schema=schema_str, json_input=json.dumps(inputs["json_input"], indent=4))
 
-    # Configurar o modelo de linguagem (OpenAI GPT)
-    llm = OpenAI(temperature=0.0)
-
-    # Gerar o mapeamento
-    mapping_output = llm(_input.to_string())
+    # Gerar o mapeamento com o modelo de linguagem (OpenAI GPT) compartilhado
+    with models.acquire("openai") as llm:
+        mapping_output = llm(_input.to_string())
 
     # Converter o mapeamento de string para JSON
     mapping = json.loads(mapping_output)
@@ -188,16 +150,14 @@ prompt = PromptTemplate(
     partial_variables={"format_instructions": format_instructions}
 )
 
-# Configurar o modelo de linguagem (OpenAI GPT)
-llm = OpenAI(temperature=0.0)
-
 # Etapa 5: Chain para gerar a saída do modelo
 def generate_output(inputs: dict) -> dict:
     """
     Função para gerar a saída do modelo de linguagem.
     """
     _input = prompt.format_prompt(json_string=inputs["json_string"])
-    output = llm(_input.to_string())
+    with models.acquire("openai") as llm:
+        output = llm(_input.to_string())
     return {"model_output": output}
 
 
@@ -235,8 +195,156 @@ sequential_chain = SequentialChain(
     output_variables=["parsed_output"]
 )
 
-# Executar a chain com o JSON de entrada
-result = sequential_chain({"json_input": original_json})
+# Processamento em lote: as mesmas etapas, com as chamadas à OpenAI feitas de
+# forma assíncrona e concorrente por um cliente compartilhado
+
+# Função para decodificar o JSON gerado pela LLM, reparando saídas quase válidas
+def decode_model_json(text: str):
+    """
+    Decodifica o primeiro objeto JSON da saída, com reparo local se necessário.
+    """
+    try:
+        return parse_json_output(text)
+    except JsonParseError:
+        return repair_json(text)
+
+
+class MappingMemo:
+    """
+    Mapeamentos gerados durante o lote, por estrutura do documento: documentos
+    com a mesma forma (inclusive os que chegam enquanto o mapeamento ainda
+    está sendo gerado) fazem uma única chamada à LLM.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._mappings = {}
+
+    async def get(self, json_input):
+        fingerprint = structural_fingerprint(json_input, response_schemas)
+        task = self._mappings.get(fingerprint)
+        # Uma geração que falhou ou foi cancelada é refeita (``exception()``
+        # levantaria CancelledError numa tarefa cancelada)
+        if task is None or (task.done() and (task.cancelled() or task.exception() is not None)):
+            task = asyncio.ensure_future(self._generate(json_input))
+            self._mappings[fingerprint] = task
+        return await asyncio.shield(task)
 
-# Imprimir o JSON final
-print(json.dumps(result["parsed_output"], indent=4))
\ No newline at end of file
+    async def _generate(self, json_input):
+        _input = mapping_prompt.format_prompt(schema=schema_str, json_input=json_codec.dumps(json_input))
+        return decode_model_json(await self.client.complete(_input.to_string()))
+
+
+async def transform_document(client, mappings, json_input) -> dict:
+    """
+    Executa as etapas da SequentialChain para um documento.
+    """
+    mapping = await mappings.get(json_input)
+    extracted_data = extract_data(json_input, mapping)
+    # JSON compacto no prompt: menos tokens contra o limite de TPM
+    _input = prompt.format_prompt(json_string=json_codec.dumps(extracted_data))
+    model_output = decode_model_json(await client.complete(_input.to_string()))
+    return check_output(model_output, response_schemas)
+
+
+def iter_documents(paths):
+    """
+    Documentos de entrada como pares (origem, texto JSON): arquivos ``.json``
+    (um documento), ``.jsonl`` (um por linha) ou diretórios com esses arquivos.
+    Um arquivo ausente ou ilegível vem como o par (origem, exceção), para ser
+    reportado como erro desse documento sem interromper o lote.
+    """
+    for path in paths:
+        try:
+            if os.path.isdir(path):
+                names = sorted(name for name in os.listdir(path) if name.endswith((".json", ".jsonl")))
+                yield from iter_documents(os.path.join(path, name) for name in names)
+            elif path.endswith(".jsonl"):
+                with open(path, encoding="utf-8") as file:
+                    for line_number, line in enumerate(file, 1):
+                        if line.strip():
+                            yield f"{path}:{line_number}", line
+            else:
+                with open(path, encoding="utf-8") as file:
+                    yield path, file.read()
+        except (OSError, UnicodeDecodeError) as e:
+            # Num .jsonl ilegível no meio, as linhas anteriores já foram entregues
+            yield path, e
+
+
+async def run_batch(paths, output, concurrency, **client_options):
+    """
+    Processa os documentos com ``concurrency`` tarefas simultâneas, gravando
+    uma linha JSON por documento (na ordem de conclusão) em ``output``.
+    """
+    documents = iter_documents(paths)
+    counts = {"success": 0, "error": 0}
+    started = time.perf_counter()
+
+    async with CompletionClient(concurrency=concurrency, cache=llm_cache, **client_options) as client:
+        mappings = MappingMemo(client)
+
+        async def worker():
+            # O iterador é compartilhado: cada tarefa pega o próximo documento livre
+            for source, text in documents:
+                try:
+                    if isinstance(text, Exception):
+                        raise text  # arquivo ausente ou ilegível
+                    parsed_output = await transform_document(client, mappings, json_codec.loads(text))
+                    result = {"source": source, "status": "success", "output": parsed_output}
+                except Exception as e:
+                    logging.error(f"Erro ao processar {source}: {e}")
+                    result = {"source": source, "status": "error", "message": str(e)}
+                counts[result["status"]] += 1
+                output.write(json_codec.dumps(result) + "\n")
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    elapsed = time.perf_counter() - started
+    total = counts["success"] + counts["error"]
+    logging.info(
+        f"{total} documentos em {elapsed:.2f}s ({total / elapsed if elapsed else 0:.1f}/s), "
+        f"{counts['error']} com erro; API: {client.stats}"
+    )
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transforma documentos JSON com a OpenAI, em lote e de forma concorrente.")
+    parser.add_argument("inputs", nargs="*", help="arquivos .json/.jsonl ou diretórios; sem entradas, executa o exemplo")
+    parser.add_argument("--output", help="arquivo JSONL de saída (padrão: saída padrão)")
+    parser.add_argument("--concurrency", type=int, default=OPENAI_CONCURRENCY, help="documentos processados ao mesmo tempo")
+    parser.add_argument("--rpm", type=int, default=int(os.environ.get("OPENAI_RPM", "500")), help="requisições por minuto (0 sem limite)")
+    parser.add_argument("--tpm", type=int, default=int(os.environ.get("OPENAI_TPM", "200000")), help="tokens por minuto (0 sem limite)")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument("--model", default=os.environ.get("OPENAI_MODEL", "gpt-3.5-turbo-instruct"))
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"), help="servidor compatível com a API da OpenAI")
+    args = parser.parse_args(argv)
+
+    if not args.inputs:
+        # Executar a chain com o JSON de entrada
+        result = sequential_chain({"json_input": original_json})
+
+        # Imprimir o JSON final
+        print(json.dumps(result["parsed_output"], indent=4))
+        return 0
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # sem uma linha por requisição
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        counts = asyncio.run(run_batch(
+            args.inputs, output, args.concurrency,
+            model=args.model, base_url=args.base_url,
+            requests_per_minute=args.rpm, tokens_per_minute=args.tpm,
+            max_retries=args.max_retries, max_tokens=args.max_tokens,
+        ))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+"""
+Cache exato e persistente das respostas das LLMs.
+
+A chave combina o modelo e seus parâmetros de geração (o ``llm_string`` do
+LangChain) com o hash do prompt. As respostas ficam em duas camadas: um LRU em
+memória, por processo, sobre um banco SQLite em disco compartilhado entre
+execuções e scripts, com expiração (TTL) e remoção das entradas menos usadas
+quando o banco passa de ``max_bytes``. O tamanho total do banco fica numa
+tabela própria, atualizada por gatilhos na mesma transação de cada gravação,
+de modo que todos os processos decidem a remoção pelo mesmo total. O arquivo
+só é aberto (e criado) no primeiro uso do cache.
+
+``LLMResponseCache`` implementa o ``BaseCache`` do LangChain: instalado com
+``set_llm_cache`` (ver ``model_registry.py``), vale para toda chamada
+``invoke``/``generate`` de LLMs e chat models. Os caminhos que não passam pelo
+LangChain (streaming, cliente OpenAI assíncrono) usam ``llm_string`` e as
+funções ``lookup_text``/``update_text``.
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.caches import BaseCache
+from langchain_core.globals import get_llm_cache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+from metrics import cache_requests
+
+
+def _stable(value):
+    # Representação estável entre processos de um parâmetro de geração; objetos
+    # sem representação estável (ponteiros, por exemplo) apenas deixam de acertar
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_stable(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _stable(item) for key, item in sorted(value.items())}
+    state = getattr(value, "__dict__", None)
+    name = f"{type(value).__module__}.{type(value).__qualname__}"
+    return [name, _stable(state)] if state is not None else repr(value)
+
+
+def llm_string(llm, **params) -> str:
+    """
+    Identificador do modelo e dos parâmetros de geração, no mesmo formato do
+    LangChain, incluindo parâmetros extras da chamada (gramática, etc.).
+    """
+    merged = llm.dict()
+    merged.update(params)
+    return str(sorted((key, _stable(value)) for key, value in merged.items()))
+
+
+def cache_for(llm):
+    """
+    Cache usado pelas chamadas de ``llm`` fora do LangChain: o do próprio
+    modelo, o global (``set_llm_cache``) ou None se desativado.
+    """
+    cache = getattr(llm, "cache", None)
+    if cache is False:
+        return None
+    if isinstance(cache, BaseCache):
+        return cache
+    return get_llm_cache()
+
+
+def _key(prompt, llm_string):
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+def _dump_generations(generations) -> str:
+    items = []
+    for generation in generations:
+        item = {"text": generation.text, "generation_info": generation.generation_info}
+        if isinstance(generation, ChatGeneration):
+            item["message"] = message_to_dict(generation.message)
+        items.append(item)
+    return json.dumps(items, ensure_ascii=False)
+
+
+def _load_generations(payload):
+    generations = []
+    for item in json.loads(payload):
+        if "message" in item:
+            message = messages_from_dict([item["message"]])[0]
+            generations.append(ChatGeneration(message=message, generation_info=item["generation_info"]))
+        else:
+            generations.append(Generation(text=item["text"], generation_info=item["generation_info"]))
+    return generations
+
+
+class LLMResponseCache(BaseCache):
+    """
+    LRU em memória (``memory_entries``) sobre SQLite em ``path`` (ou só em
+    memória, se ``path`` for None), com TTL em segundos (0 desativa) e limite
+    de tamanho do banco.
+    """
+
+    def __init__(self, path=None, memory_entries=256, max_bytes=256 * 1024 * 1024, ttl=0):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._memory = OrderedDict()  # chave -> (gerações, expiração)
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._db = None
+
+    def _connect(self):
+        # Chamado com ``_lock`` adquirido: abre o banco no primeiro uso, para
+        # que importar o registro de modelos não crie arquivos
+        if self._db is not None or not self.path:
+            return self._db
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        # WAL: vários processos (app, scripts) leem e gravam o mesmo arquivo
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            # Tamanho total do banco, mantido pelos gatilhos na mesma transação
+            # de cada inserção, substituição ou remoção
+            db.execute("CREATE TABLE IF NOT EXISTS usage (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)")
+            db.execute("INSERT OR IGNORE INTO usage (id, bytes) SELECT 0, COALESCE(SUM(size), 0) FROM responses")
+            db.execute(
+                "CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses "
+                "BEGIN UPDATE usage SET bytes = bytes + NEW.size; END"
+            )
+            db.execute(
+                "CREATE TRIGGER IF NOT EXISTS responses_update AFTER UPDATE OF size ON responses "
+                "BEGIN UPDATE usage SET bytes = bytes + NEW.size - OLD.size; END"
+            )
+            db.execute(
+                "CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses "
+                "BEGIN UPDATE usage SET bytes = bytes - OLD.size; END"
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            db.close()
+            raise
+        self._db = db
+        self._evict(time.time())
+        return db
+
+    def _expires(self, created):
+        return created + self.ttl if self.ttl else float("inf")
+
+    def _remember(self, key, generations, expires):
+        # Chamado com ``_lock`` adquirido
+        self._memory[key] = (generations, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def lookup(self, prompt, llm_string):
+        key = _key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                cache_requests.inc(cache="llm", result="hit")
+                return entry[0]
+            self._memory.pop(key, None)
+
+            row = None
+            if self._connect() is not None:
+                row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and self._expires(row[1]) <= now:
+                    self._delete(key)
+                    row = None
+            if row is None:
+                self._stats["misses"] += 1
+                cache_requests.inc(cache="llm", result="miss")
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            generations = _load_generations(row[0])
+            self._remember(key, generations, self._expires(row[1]))
+            self._stats["disk_hits"] += 1
+            cache_requests.inc(cache="llm", result="hit")
+            return generations
+
+    def update(self, prompt, llm_string, return_val):
+        key = _key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            self._remember(key, return_val, self._expires(now))
+            if self._connect() is None:
+                return
+            payload = _dump_generations(return_val)
+            size = len(payload.encode("utf-8"))
+            # Upsert (e não REPLACE): a substituição passa pelo gatilho de UPDATE
+            self._db.execute(
+                "INSERT INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                "created = excluded.created, accessed = excluded.accessed",
+                (key, payload, size, now, now),
+            )
+            # Total do banco inteiro, com as gravações dos outros processos
+            if self._total() > self.max_bytes:
+                self._evict(now)
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._memory.clear()
+            if self._connect() is not None:
+                self._db.execute("DELETE FROM responses")
+
+    def lookup_text(self, prompt, llm_string):
+        """
+        Texto em cache para chamadas fora do LangChain, ou None.
+        """
+        generations = self.lookup(prompt, llm_string)
+        return generations[0].text if generations else None
+
+    def update_text(self, prompt, llm_string, text):
+        self.update(prompt, llm_string, [Generation(text=text)])
+
+    def stats(self) -> dict:
+        """
+        Acertos por camada, falhas, remoções e ocupação atual.
+        """
+        with self._lock:
+            disk_bytes = self._total() if self._connect() is not None else 0
+            return {**self._stats, "memory_entries": len(self._memory), "disk_bytes": disk_bytes}
+
+    def _total(self):
+        return self._db.execute("SELECT bytes FROM usage").fetchone()[0]
+
+    def _delete(self, key):
+        self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def _evict(self, now):
+        # Chamado com ``_lock`` adquirido: remove as expiradas e, se o banco
+        # ainda passar do limite, as menos usadas (até 90% do limite). A
+        # transação impede que dois processos removam ao mesmo tempo
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            if self.ttl:
+                deleted = self._db.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,)).rowcount
+                self._stats["evictions"] += max(deleted, 0)
+            total = self._total()
+            if total > self.max_bytes:
+                excess = total - int(self.max_bytes * 0.9)
+                removed = []
+                for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed"):
+                    removed.append((key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                self._db.executemany("DELETE FROM responses WHERE key = ?", removed)
+                self._stats["evictions"] += len(removed)
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
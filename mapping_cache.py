@@ -0,0 +1,140 @@
+"""
+Cache de mapeamentos por impressão digital estrutural.
+
+Entradas com a mesma forma (mesmas chaves, mesmo aninhamento e mesmo schema
+dos itens das listas) sempre precisam do mesmo mapeamento, então o resultado de
+``generate_mapping`` pode ser reaproveitado sem chamar a LLM novamente.
+"""
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+
+def structural_shape(value):
+    """
+    Reduz um JSON à sua forma: chaves e aninhamento, sem os valores.
+    """
+    if isinstance(value, dict):
+        return {key: structural_shape(item) for key, item in sorted(value.items())}
+    if isinstance(value, list):
+        # Schema dos itens: formas distintas, independente da quantidade
+        shapes = {}
+        for item in value:
+            shape = structural_shape(item)
+            shapes.setdefault(json.dumps(shape, sort_keys=True), shape)
+        return [shapes[key] for key in sorted(shapes)]
+    # O mapeamento só depende das chaves, não do tipo dos valores
+    return None
+
+
+def structural_fingerprint(json_input, response_schemas):
+    """
+    Impressão digital da forma de ``json_input`` combinada com a definição dos
+    ``response_schemas``.
+    """
+    schemas = [[schema.name, schema.description, schema.type] for schema in response_schemas]
+    payload = json.dumps([structural_shape(json_input), schemas], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MappingCache:
+    """
+    Cache LRU em memória, limitado por número de entradas e por tamanho, com
+    persistência opcional em disco.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=16 * 1024 * 1024, path=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # fingerprint -> (mapping, tamanho)
+        self._size = 0
+        self._lock = threading.Lock()
+
+        if path:
+            self._load()
+
+    def get(self, fingerprint):
+        """
+        Retorna o mapeamento em cache ou None.
+        """
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, fingerprint, mapping):
+        """
+        Armazena um mapeamento, removendo os menos usados quando necessário.
+        """
+        size = len(json.dumps(mapping))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(fingerprint, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[fingerprint] = (mapping, size)
+            self._size += size
+            self._evict()
+            if self.path:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            if self.path:
+                self._save()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+            _, (_, size) = self._entries.popitem(last=False)
+            self._size -= size
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as cache_file:
+                stored = json.load(cache_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Cache de mapeamentos ignorado ({self.path}): {e}")
+            return
+
+        # O arquivo é salvo do menos para o mais recente
+        for fingerprint, mapping in stored:
+            size = len(json.dumps(mapping))
+            self._entries[fingerprint] = (mapping, size)
+            self._size += size
+        self._evict()
+
+    def _save(self):
+        # Escrita atômica para não corromper o cache em caso de falha
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".mapping_cache")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as tmp_file:
+                json.dump([[fingerprint, mapping] for fingerprint, (mapping, _) in self._entries.items()], tmp_file)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Falha ao salvar o cache de mapeamentos: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
@@ -0,0 +1,281 @@
+"""
+Motor de mapeamento compilado.
+
+Um mapeamento (o mesmo formato gerado pela LLM em ``generate_mapping``) é
+compilado uma única vez em uma função Python especializada: os caminhos viram
+acessos diretos e a projeção das listas (ramo ``orders``) vira uma list
+comprehension com as chaves já resolvidas. O objeto compilado pode então ser
+executado sobre um documento ou sobre um lote inteiro.
+"""
+from collections import namedtuple
+from functools import lru_cache
+import json
+import math
+
+try:
+    import numpy as np
+except ImportError:  # NumPy é opcional: sem ele as colunas são listas
+    np = None
+
+# Plano de um campo do mapeamento
+#   kind: "value" (caminho simples) ou "list" (projeção de lista)
+#   projection: pares (chave de saída, chave de origem) do ramo de lista
+FieldPlan = namedtuple("FieldPlan", ["key", "kind", "path", "default", "projection"])
+
+# Tipos que podem ser embutidos como literais no código gerado
+_LITERAL_TYPES = (str, int, float, bool, type(None))
+
+
+def walk_path(data, path):
+    """
+    Percorre o caminho no JSON com a mesma semântica de ``extract_data``.
+    """
+    current_data = data
+    for step in path:
+        if isinstance(current_data, list):
+            # Se o caminho aponta para uma lista, iterar sobre os itens
+            current_data = [item.get(step, {}) for item in current_data]
+        else:
+            # Se o caminho aponta para um objeto, acessar diretamente
+            current_data = current_data.get(step, {})
+
+        # Se o valor for None, interromper o loop
+        if current_data is None:
+            break
+
+    return current_data
+
+
+def plan_mapping(mapping):
+    """
+    Converte o dicionário de mapeamento em uma lista de ``FieldPlan``.
+    """
+    plan = []
+    for key, value in mapping.items():
+        if isinstance(value, dict):
+            plan.append(FieldPlan(key, "value", tuple(value.get("path", [])), value.get("default", None), None))
+        elif isinstance(value, list):
+            spec = value[0]
+            projection = tuple((sub_key, sub_value) for sub_key, sub_value in spec.items() if sub_key != "path")
+            plan.append(FieldPlan(key, "list", tuple(spec.get("path", [])), None, projection))
+    return plan
+
+
+# Tipo Python -> dtype NumPy das colunas homogêneas
+_COLUMN_DTYPES = {int: "int64", float: "float64", bool: "bool"}
+
+
+def _typed_column(values):
+    # Array tipado quando todos os valores são do mesmo tipo numérico ou
+    # booleano; caso contrário, array de objetos (strings, None, mistos)
+    types = set(map(type, values))
+    if len(types) == 1:
+        dtype = _COLUMN_DTYPES.get(types.pop())
+        if dtype is not None:
+            try:
+                return np.fromiter(values, dtype=dtype, count=len(values))
+            except OverflowError:
+                pass  # inteiros fora do int64
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+class Columns:
+    """
+    Projeção de lista em formato colunar: uma coluna por chave de saída.
+
+    Com NumPy instalado, colunas homogêneas de inteiros, floats ou booleanos
+    são arrays tipados e as demais são arrays de objetos; sem NumPy, cada
+    coluna é uma lista. ``to_rows()`` devolve a mesma lista de dicionários do
+    modo por linhas.
+    """
+
+    def __init__(self, columns, length):
+        self.columns = columns
+        self.length = length
+
+    @classmethod
+    def from_items(cls, items, projection):
+        """
+        Monta as colunas direto dos itens, sem criar um dicionário por item.
+        """
+        items = items if isinstance(items, list) else list(items)
+        columns = {}
+        for sub_key, sub_value in projection:
+            values = [item.get(sub_value) for item in items]
+            columns[sub_key] = _typed_column(values) if np is not None else values
+        return cls(columns, len(items))
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def keys(self):
+        return self.columns.keys()
+
+    def __repr__(self):
+        return f"Columns({list(self.columns)}, length={self.length})"
+
+    def to_rows(self):
+        """
+        Lista de dicionários, igual à saída de ``extract_data``.
+        """
+        names = list(self.columns)
+        values = [column.tolist() if np is not None else column for column in self.columns.values()]
+        return [dict(zip(names, row)) for row in zip(*values)] if names else [{} for _ in range(self.length)]
+
+    def to_dataframe(self):
+        """
+        DataFrame do pandas sobre as mesmas colunas (``copy=False``): os
+        arrays tipados são usados sem cópia.
+        """
+        import pandas as pd
+
+        return pd.DataFrame(self.columns, copy=False)
+
+
+class _SourceBuilder:
+    """
+    Acumula o código-fonte da função de extração e as constantes que não
+    podem ser escritas como literais.
+    """
+
+    def __init__(self):
+        self.lines = ["def _extract(data):", "    output = {}"]
+        self.namespace = {"_walk_path": walk_path, "_Columns": Columns}
+
+    def const(self, value):
+        # NaN e infinitos não têm literal (repr gera ``nan``/``inf``): vão para o namespace
+        if type(value) in _LITERAL_TYPES and not (type(value) is float and not math.isfinite(value)):
+            return repr(value)
+        name = f"_c{len(self.namespace)}"
+        self.namespace[name] = value
+        return name
+
+    def lookup(self, path, target):
+        if not all(type(step) is str for step in path):
+            # Passos não textuais poderiam indexar listas diretamente, o que
+            # mudaria a semântica; usar sempre o percurso genérico
+            self.lines.append(f"    {target} = _walk_path(data, {self.const(path)})")
+            return
+
+        # Acesso direto pelo caminho; listas no meio do caminho e chaves
+        # ausentes caem no percurso genérico, que reproduz a semântica original
+        access = "data" + "".join(f"[{self.const(step)}]" for step in path)
+        self.lines += [
+            "    try:",
+            f"        {target} = {access}",
+            "    except (KeyError, TypeError):",
+            f"        {target} = _walk_path(data, {self.const(path)})",
+        ]
+
+    def build(self):
+        self.lines.append("    return output")
+        exec(compile("\n".join(self.lines), "<compiled mapping>", "exec"), self.namespace)
+        return self.namespace["_extract"]
+
+
+class CompiledMapping:
+    """
+    Mapeamento compilado, reutilizável para qualquer número de documentos.
+
+    Produz exatamente a mesma saída que ``extract_data(data, mapping)``.
+    """
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+        self.fields = plan_mapping(mapping)
+        self._extract = self._compile()
+        self._extract_columnar = None
+
+    def _compile(self, columnar=False):
+        source = _SourceBuilder()
+
+        for field in self.fields:
+            key = source.const(field.key)
+
+            if field.kind == "value":
+                source.lookup(field.path, "current_data")
+                source.lines += [
+                    # Se o caminho resultou em uma lista, pegar o primeiro item
+                    "    if isinstance(current_data, list) and current_data:",
+                    "        current_data = current_data[0]",
+                    f"    output[{key}] = current_data if current_data is not None else {source.const(field.default)}",
+                ]
+            elif columnar:
+                source.lookup(field.path, "items")
+                source.lines.append(f"    output[{key}] = _Columns.from_items(items, {source.const(field.projection)})")
+            else:
+                # Projeção da lista: um dicionário literal por item, sem
+                # reinterpretar o mapeamento a cada item
+                items = ", ".join(
+                    f"{source.const(sub_key)}: item.get({source.const(sub_value)})"
+                    for sub_key, sub_value in field.projection
+                )
+                source.lookup(field.path, "items")
+                source.lines.append(f"    output[{key}] = [{{{items}}} for item in items]")
+
+        return source.build()
+
+    def extract(self, data):
+        """
+        Extrai os dados de um único documento.
+        """
+        return self._extract(data)
+
+    def extract_columnar(self, data):
+        """
+        Como ``extract``, mas as projeções de lista são devolvidas como
+        ``Columns`` em vez de uma lista de dicionários.
+        """
+        if self._extract_columnar is None:
+            self._extract_columnar = self._compile(columnar=True)
+        return self._extract_columnar(data)
+
+    def extract_many(self, documents):
+        """
+        Extrai os dados de um lote de documentos, preservando a ordem.
+        """
+        return list(map(self._extract, documents))
+
+    def iter_extract(self, documents):
+        """
+        Versão preguiçosa de ``extract_many`` para lotes grandes ou iteradores.
+        """
+        return map(self._extract, documents)
+
+
+def compile_mapping(mapping):
+    """
+    Compila um mapeamento, reaproveitando a compilação de mapeamentos iguais.
+    """
+    try:
+        cache_key = json.dumps(mapping)
+    except (TypeError, ValueError):
+        return CompiledMapping(mapping)
+    return _compile_cached(cache_key)
+
+
+@lru_cache(maxsize=128)
+def _compile_cached(cache_key):
+    return CompiledMapping(json.loads(cache_key))
+
+
+def extract_data(data, mapping):
+    """
+    Extrai dados dinamicamente de um JSON usando um mapeamento.
+    """
+    return compile_mapping(mapping).extract(data)
+
+
+def extract_columnar(data, mapping):
+    """
+    Extrai dados como ``extract_data``, com as listas em formato colunar.
+    """
+    return compile_mapping(mapping).extract_columnar(data)
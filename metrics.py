@@ -0,0 +1,219 @@
+"""
+Métricas do workflow no formato texto do Prometheus.
+
+Contadores e histogramas com rótulos, um decorador para instrumentar as
+etapas das TransformChains e a coleta dos tempos de cada requisição.
+"""
+from bisect import bisect_left
+from contextlib import contextmanager
+import contextvars
+import functools
+import threading
+import time
+
+# Buckets padrão de tempo (segundos) e de contagem de tokens
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    """
+    Contador monotônico com rótulos.
+    """
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Histogram:
+    """
+    Histograma com buckets fixos e rótulos.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # rótulos -> [contagens por bucket, soma, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {count}"
+
+
+class MetricsRegistry:
+    """
+    Conjunto de métricas exportadas em ``/metrics``.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram("workflow_stage_seconds", "Tempo de execução de cada etapa do workflow.", ["stage"])
+stage_failures = registry.counter("workflow_stage_failures_total", "Falhas em cada etapa do workflow.", ["stage"])
+prompt_tokens = registry.histogram("llm_prompt_tokens", "Tokens do prompt enviado à LLM.", ["stage"], TOKEN_BUCKETS)
+generated_tokens = registry.histogram("llm_generated_tokens", "Tokens gerados pela LLM.", ["stage"], TOKEN_BUCKETS)
+prompt_eval_seconds = registry.histogram("llm_prompt_eval_seconds", "Tempo até o primeiro token (avaliação do prompt).", ["stage"])
+decode_seconds = registry.histogram("llm_decode_seconds", "Tempo de decodificação após o primeiro token.", ["stage"])
+tokens_per_second = registry.histogram("llm_tokens_per_second", "Velocidade de decodificação.", ["stage"], RATE_BUCKETS)
+cache_requests = registry.counter("cache_requests_total", "Consultas aos caches, por resultado.", ["cache", "result"])
+json_repairs = registry.counter("json_repairs_total", "Tentativas de reparo de JSON inválido gerado pela LLM, por camada e resultado.", ["stage", "tier", "result"])
+
+# Tempos da requisição corrente (etapa -> segundos)
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def request_timings():
+    """
+    Coleta os tempos das etapas executadas dentro do bloco.
+    """
+    timings = {}
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def record_timing(name, seconds):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = round(timings.get(name, 0.0) + seconds, 6)
+
+
+def timed_stage(stage):
+    """
+    Decorador que mede o tempo e conta as falhas de uma etapa do workflow.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            except Exception:
+                stage_failures.inc(stage=stage)
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                stage_seconds.observe(elapsed, stage=stage)
+                record_timing(stage, elapsed)
+
+        return wrapper
+
+    return decorator
+
+
+class GenerationTimer:
+    """
+    Mede uma geração com streaming: tokens do prompt, tempo até o primeiro
+    token (avaliação do prompt), tempo de decodificação e tokens por segundo.
+
+    Use ``timer.on_token`` como callback do streaming.
+    """
+
+    def __init__(self, stage, llm, prompt_text, on_token=None):
+        self.stage = stage
+        self.prompt_tokens = llm.get_num_tokens(prompt_text)
+        self.generated_tokens = 0
+        self._on_token = on_token
+        self._start = None
+        self._first_token = None
+
+    def on_token(self, token):
+        if self._first_token is None:
+            self._first_token = time.perf_counter()
+        self.generated_tokens += 1
+        if self._on_token is not None:
+            self._on_token(token)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        first_token = self._first_token or end
+        prompt_eval = first_token - self._start
+        decode = end - first_token
+
+        prompt_tokens.observe(self.prompt_tokens, stage=self.stage)
+        generated_tokens.observe(self.generated_tokens, stage=self.stage)
+        prompt_eval_seconds.observe(prompt_eval, stage=self.stage)
+        decode_seconds.observe(decode, stage=self.stage)
+        if decode > 0:
+            tokens_per_second.observe(self.generated_tokens / decode, stage=self.stage)
+
+        record_timing(f"{self.stage}.prompt_eval", prompt_eval)
+        record_timing(f"{self.stage}.decode", decode)
+        return False
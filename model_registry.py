@@ -0,0 +1,299 @@
+"""
+Registro compartilhado de modelos.
+
+Cada modelo é carregado uma única vez (sob demanda) e emprestado aos pontos de
+entrada com um limite de uso concorrente por modelo. Todos os scripts do
+projeto obtêm seus modelos por aqui em vez de construir ``LlamaCpp`` ou
+``OpenAI`` diretamente.
+"""
+from contextlib import contextmanager
+import logging
+import os
+import threading
+
+
+class _ModelPool:
+    """
+    Pool de instâncias de um modelo.
+
+    Modelos ``shareable`` (clientes HTTP thread-safe) usam uma única instância
+    para até ``max_concurrency`` usuários simultâneos. Os demais (LlamaCpp) são
+    emprestados com exclusividade, com no máximo ``max_concurrency`` cópias.
+    """
+
+    def __init__(self, name, factory, max_concurrency=1, shareable=False):
+        self.name = name
+        self.factory = factory
+        self.max_concurrency = max_concurrency
+        self.shareable = shareable
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._idle_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._idle = []
+        self._instances = []
+        self.warm = False
+        self.warmup_error = None
+
+    @property
+    def loaded(self):
+        return bool(self._instances)
+
+    def warmup(self, run):
+        """
+        Carrega todas as cópias do modelo e executa ``run`` em cada uma.
+        """
+        count = 1 if self.shareable else self.max_concurrency
+        instances = []
+        try:
+            # Segurar as cópias já aquecidas força o carregamento das seguintes
+            for _ in range(count):
+                instance = self.acquire()
+                instances.append(instance)
+                run(instance)
+            self.warm = True
+            self.warmup_error = None
+        except Exception as e:
+            self.warmup_error = str(e)
+            raise
+        finally:
+            for instance in instances:
+                self.release(instance)
+
+    def _load(self):
+        # Chamado com ``_load_lock`` adquirido
+        logging.info(f"Carregando o modelo {self.name}")
+        instance = self.factory()
+        self._instances.append(instance)
+        return instance
+
+    def primary(self):
+        """
+        Primeira instância do modelo, carregada uma única vez.
+        """
+        with self._load_lock:
+            if not self._instances:
+                instance = self._load()
+                if not self.shareable:
+                    with self._idle_lock:
+                        self._idle.append(instance)
+            return self._instances[0]
+
+    def acquire(self, timeout=None):
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"Nenhuma instância do modelo {self.name} disponível.")
+        try:
+            if self.shareable:
+                return self.primary()
+            with self._idle_lock:
+                if self._idle:
+                    return self._idle.pop()
+            with self._load_lock:
+                # Uma cópia pode ter sido devolvida enquanto esperávamos
+                with self._idle_lock:
+                    if self._idle:
+                        return self._idle.pop()
+                # Há uma vaga livre e nenhuma cópia ociosa: carregar mais uma
+                return self._load()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, instance):
+        if not self.shareable:
+            with self._idle_lock:
+                self._idle.append(instance)
+        self._slots.release()
+
+
+class ModelRegistry:
+    """
+    Registro de modelos por nome.
+    """
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, factory, max_concurrency=1, shareable=False):
+        """
+        Registra (ou substitui) a fábrica de um modelo.
+        """
+        with self._lock:
+            self._pools[name] = _ModelPool(name, factory, max_concurrency, shareable)
+
+    def _pool(self, name):
+        try:
+            return self._pools[name]
+        except KeyError:
+            raise KeyError(f"Modelo não registrado: {name}") from None
+
+    def get(self, name):
+        """
+        Instância compartilhada do modelo, para scripts de uso sequencial.
+        """
+        return self._pool(name).primary()
+
+    @contextmanager
+    def acquire(self, name, timeout=None):
+        """
+        Empresta uma instância do modelo respeitando o limite de concorrência.
+        """
+        pool = self._pool(name)
+        instance = pool.acquire(timeout)
+        try:
+            yield instance
+        finally:
+            pool.release(instance)
+
+    def max_concurrency(self, name):
+        """
+        Limite de usos simultâneos do modelo, para quem controla a própria
+        concorrência (por exemplo, com asyncio).
+        """
+        return self._pool(name).max_concurrency
+
+    def is_loaded(self, name):
+        return self._pool(name).loaded
+
+    def warmup(self, name, run):
+        """
+        Carrega o modelo e executa ``run(instancia)`` (por exemplo, uma geração
+        curta) para trazer os pesos para a memória antes da primeira requisição.
+        """
+        pool = self._pool(name)
+        logging.info(f"Aquecendo o modelo {name}")
+        pool.warmup(run)
+        logging.info(f"Modelo {name} aquecido")
+
+    def is_warm(self, name):
+        return self._pool(name).warm
+
+    def status(self, name):
+        """
+        Estado do modelo para as rotas de saúde.
+        """
+        pool = self._pool(name)
+        return {
+            "loaded": pool.loaded,
+            "warm": pool.warm,
+            "instances": len(pool._instances),
+            "error": pool.warmup_error,
+        }
+
+
+def _llama_cpp(model_path):
+    def factory():
+        from langchain_community.llms import LlamaCpp
+
+        return LlamaCpp(
+            model_path=model_path,  # Caminho para o modelo
+            n_gpu_layers=40,  # Número de camadas do modelo a serem carregadas na GPU
+            n_batch=512,  # Tamanho do lote para processamento
+            verbose=False,  # Desabilitar logs detalhados
+        )
+
+    return factory
+
+
+def _llama_cpp_embeddings(model_path):
+    def factory():
+        # Um modelo de chat (sem pooling) dá um vetor por token e o
+        # LlamaCppEmbeddings guarda só o primeiro (BOS): toda pergunta teria
+        # quase o mesmo embedding. Também seria uma segunda cópia dos pesos.
+        if os.path.abspath(model_path) in {os.path.abspath(path) for path in LLAMA_MODEL_PATHS.values()}:
+            raise ValueError(f"EMBEDDINGS_MODEL_PATH aponta para um modelo de chat ({model_path}); use um GGUF de embeddings.")
+
+        from langchain_community.embeddings import LlamaCppEmbeddings
+        from llama_cpp import LLAMA_POOLING_TYPE_MEAN, Llama
+
+        client = Llama(
+            model_path=model_path,
+            embedding=True,
+            pooling_type=LLAMA_POOLING_TYPE_MEAN,  # um vetor por texto, mesmo sem pooling no GGUF
+            n_gpu_layers=40,
+            n_batch=512,
+            verbose=False,
+        )
+        if "tokenizer.chat_template" in client.metadata:
+            logging.warning(f"{model_path} parece ser um modelo de chat, não de embeddings: o cache semântico pode errar")
+        return LlamaCppEmbeddings(model_path=model_path, client=client)
+
+    return factory
+
+
+def _openai(**kwargs):
+    def factory():
+        from langchain.llms import OpenAI
+
+        return OpenAI(**kwargs)
+
+    return factory
+
+
+def _chat_openai():
+    from langchain.chat_models import ChatOpenAI
+
+    return ChatOpenAI(openai_api_key=os.environ["OPENAI_API_KEY"], temperature=0)
+
+
+def _fake_llm():
+    from fake_llm import FakeLLM
+
+    return FakeLLM(
+        latency=float(os.environ.get("FAKE_LLM_LATENCY", "0.05")),
+        tokens_per_second=float(os.environ.get("FAKE_LLM_TOKENS_PER_SECOND", "50")),
+    )
+
+
+# Backend das LLMs: "fake" troca todos os modelos pela FakeLLM, para testar a
+# camada HTTP sem carregar os modelos
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "default")
+
+
+def _fake_embeddings():
+    from fake_llm import HashingEmbeddings
+
+    return HashingEmbeddings()
+
+
+def _backend(factory, fake=_fake_llm):
+    return fake if LLM_BACKEND == "fake" else factory
+
+
+# Concorrência por modelo: LlamaCpp não é thread-safe, então cada uso
+# simultâneo exige uma cópia do modelo em memória
+LLAMA_CONCURRENCY = int(os.environ.get("LLAMA_CONCURRENCY", "1"))
+OPENAI_CONCURRENCY = int(os.environ.get("OPENAI_CONCURRENCY", "8"))
+
+# Cache exato das respostas, compartilhado por todos os scripts que usam o
+# registro (desativado com LLM_CACHE=0)
+llm_cache = None
+if os.environ.get("LLM_CACHE", "1") != "0":
+    from langchain_core.globals import set_llm_cache
+    from llm_cache import LLMResponseCache
+
+    llm_cache = LLMResponseCache(
+        path=os.environ.get("LLM_CACHE_PATH", "llm_cache.sqlite3"),
+        memory_entries=int(os.environ.get("LLM_CACHE_MEMORY_ENTRIES", "256")),
+        max_bytes=int(os.environ.get("LLM_CACHE_BYTES", str(256 * 1024 * 1024))),
+        ttl=float(os.environ.get("LLM_CACHE_TTL", str(30 * 24 * 3600))),
+    )
+    set_llm_cache(llm_cache)
+
+# GGUFs dos modelos locais de geração
+LLAMA_MODEL_PATHS = {
+    "codellama-7b": "models/codellama-7b.Q4_K_M.gguf",
+    "llama-2-7b-chat": "models/llama-2-7b-chat.Q4_K_M.gguf",
+}
+
+models = ModelRegistry()
+for name, path in LLAMA_MODEL_PATHS.items():
+    models.register(name, _backend(_llama_cpp(path)), LLAMA_CONCURRENCY)
+models.register("openai", _backend(_openai(temperature=0.0)), OPENAI_CONCURRENCY, shareable=True)
+models.register("gpt-4o-mini", _backend(_openai(model="gpt-4o-mini")), OPENAI_CONCURRENCY, shareable=True)
+models.register("chat-openai", _backend(_chat_openai), OPENAI_CONCURRENCY, shareable=True)
+
+# Modelo de embeddings do cache semântico do chat: um GGUF próprio de
+# embeddings em models/, não um dos modelos de chat
+EMBEDDINGS_MODEL_PATH = os.environ.get("EMBEDDINGS_MODEL_PATH", "models/nomic-embed-text-v1.5.Q4_K_M.gguf")
+models.register("llama-embeddings", _backend(_llama_cpp_embeddings(EMBEDDINGS_MODEL_PATH), _fake_embeddings))
@@ -0,0 +1,194 @@
+"""
+Cliente assíncrono da API de completions da OpenAI para processamento em lote.
+
+Um único ``httpx.AsyncClient`` (com pool de conexões) é compartilhado por
+todas as requisições, que respeitam limites de requisições e de tokens por
+minuto (token buckets) e são repetidas com backoff exponencial em erros
+transitórios (429, 5xx, falhas de conexão). Funciona também contra servidores
+compatíveis com a API da OpenAI, como o servidor de testes de ``fake_llm.py``.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+
+import httpx
+import openai
+
+# Erros transitórios, repetidos com backoff
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimativa do número de tokens (cerca de 4 caracteres por token), usada
+    para reservar a cota antes de a API informar o consumo real.
+    """
+    return len(text) // 4 + 1
+
+
+class _TokenBucket:
+    """
+    Token bucket com capacidade e reposição de ``per_minute`` unidades por
+    minuto. ``per_minute`` igual a 0 desativa o limite.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def take(self, amount):
+        if self.rate <= 0:
+            return
+        amount = min(amount, self.capacity)
+        # O lock mantém a ordem de chegada: uma requisição grande não é
+        # ultrapassada indefinidamente pelas pequenas
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                await asyncio.sleep((amount - self.level) / self.rate)
+
+    def adjust(self, amount):
+        # Corrige a reserva com o consumo real (positivo cobra, negativo devolve)
+        if self.rate <= 0:
+            return
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RateLimiter:
+    """
+    Limites de requisições (RPM) e de tokens (TPM) por minuto.
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0):
+        self.requests = _TokenBucket(requests_per_minute)
+        self.tokens = _TokenBucket(tokens_per_minute)
+
+    async def acquire(self, tokens):
+        await self.requests.take(1)
+        await self.tokens.take(tokens)
+
+    def adjust(self, reserved, used):
+        self.tokens.adjust(used - reserved)
+
+
+def _retry_after(error):
+    # Espera sugerida pelo servidor, em segundos
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    for header, scale in (("retry-after-ms", 1000), ("retry-after", 1)):
+        try:
+            return float(response.headers[header]) / scale
+        except (KeyError, ValueError):
+            continue
+    return None
+
+
+class CompletionClient:
+    """
+    Completions com pool de conexões compartilhado, limites de taxa e retry.
+
+    Use com ``async with`` para fechar as conexões ao final.
+    """
+
+    def __init__(
+        self,
+        model="gpt-3.5-turbo-instruct",
+        base_url=None,
+        api_key=None,
+        concurrency=8,
+        requests_per_minute=0,
+        tokens_per_minute=0,
+        max_tokens=256,
+        max_retries=5,
+        backoff=0.5,
+        max_backoff=30.0,
+        timeout=60.0,
+        cache=None,
+    ):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            timeout=timeout,
+        )
+        # Os retries são feitos aqui, para passarem pelo limitador
+        self.client = openai.AsyncOpenAI(
+            api_key=api_key or os.environ.get("OPENAI_API_KEY"),
+            base_url=base_url,
+            http_client=self.http,
+            max_retries=0,
+        )
+        self.cache = cache
+        self.stats = {"requests": 0, "retries": 0, "cache_hits": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    async def complete(self, prompt: str, **kwargs) -> str:
+        """
+        Texto gerado para o prompt, esperando a cota e repetindo erros
+        transitórios. Respostas em ``cache`` (``LLMResponseCache``) não
+        consomem cota.
+        """
+        max_tokens = kwargs.pop("max_tokens", self.max_tokens)
+        cache_key = str(sorted({"_type": "openai-completions", "model": self.model, "max_tokens": max_tokens,
+                                "temperature": 0, "base_url": str(self.client.base_url), **kwargs}.items()))
+        if self.cache is not None:
+            text = self.cache.lookup_text(prompt, cache_key)
+            if text is not None:
+                self.stats["cache_hits"] += 1
+                return text
+
+        reserved = estimate_tokens(prompt) + max_tokens
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(reserved)
+            self.stats["requests"] += 1
+            try:
+                response = await self.client.completions.create(
+                    model=self.model, prompt=prompt, max_tokens=max_tokens, temperature=0, **kwargs
+                )
+            except RETRYABLE_ERRORS as error:
+                # A cota reservada foi consumida pela tentativa
+                if attempt == self.max_retries:
+                    raise
+                delay = _retry_after(error)
+                if delay is None:
+                    delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                self.stats["retries"] += 1
+                logging.warning(f"Erro transitório da API ({type(error).__name__}), nova tentativa em {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            if response.usage is not None:
+                self.stats["prompt_tokens"] += response.usage.prompt_tokens
+                self.stats["completion_tokens"] += response.usage.completion_tokens
+                self.limiter.adjust(reserved, response.usage.total_tokens)
+            text = response.choices[0].text
+            if self.cache is not None:
+                self.cache.update_text(prompt, cache_key, text)
+            return text
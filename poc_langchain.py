@@ -6,10 +6,10 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options
 from PIL import Image
 from io import BytesIO
-from langchain_community.llms import LlamaCpp
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
 from urllib.parse import urlparse
+from model_registry import models
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
 from webdriver_manager.chrome import ChromeDriverManager
@@ -81,14 +81,6 @@ def capture_header_and_save(url):
 
 # Função para chamar o llama.cpp e gerar o HTML
 def generate_html_from_llama(screenshot_path, json_path):
-    # Configurar o modelo LlamaCpp
-    llm = LlamaCpp(
-        model_path="models/llama-2-7b-chat.Q4_K_M.gguf",
-        n_gpu_layers=40,
-        n_batch=512,
-        verbose=False
-    )
-
     # Template para o prompt
     template = """
     Given the following screenshot and JSON structure, generate an HTML file with CSS that represents the screenshot and fill with the contents in the json file:
@@ -100,11 +92,13 @@ def generate_html_from_llama(screenshot_path, json_path):
     """
     prompt = PromptTemplate(template=template, input_variables=["screenshot_path", "json_path"])
 
-    # Criar a cadeia de LLM
-    llm_chain = LLMChain(prompt=prompt, llm=llm)
+    # Usar o modelo LlamaCpp do registro, carregado uma única vez entre chamadas
+    with models.acquire("llama-2-7b-chat") as llm:
+        # Criar a cadeia de LLM
+        llm_chain = LLMChain(prompt=prompt, llm=llm)
 
-    # Executar a cadeia
-    result = llm_chain.run(screenshot_path=screenshot_path, json_path=json_path)
+        # Executar a cadeia
+        result = llm_chain.run(screenshot_path=screenshot_path, json_path=json_path)
 
     return result
 
@@ -0,0 +1,84 @@
+"""
+Reaproveitamento do KV-cache para os prefixos estáticos dos prompts.
+
+Cada prefixo constante (instruções, exemplos, format instructions) é avaliado
+pelo llama.cpp uma única vez; o estado do modelo logo após o prefixo é
+guardado e restaurado antes de cada requisição. Como o ``Llama`` compara os
+tokens do novo prompt com os já avaliados, apenas o sufixo específico de cada
+documento precisa ser processado.
+"""
+from collections import OrderedDict
+import logging
+import threading
+
+# Marcador usado para localizar onde a primeira variável entra no template
+_SENTINEL = "\x00prefix\x00"
+
+
+def template_prefix(prompt_template, variable: str, **kwargs) -> str:
+    """
+    Texto do template renderizado até a posição de ``variable``.
+    """
+    return prompt_template.format(**{variable: _SENTINEL}, **kwargs).split(_SENTINEL)[0]
+
+
+class PrefixCache:
+    """
+    Snapshots de estado do llama.cpp por prefixo, em LRU limitado por número
+    de entradas e por bytes.
+    """
+
+    def __init__(self, max_entries=8, max_bytes=1024 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._states = OrderedDict()  # (modelo, prefixo) -> (estado, tamanho)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, llm, prefix: str):
+        """
+        Deixa o modelo no estado logo após ``prefix``.
+
+        Deve ser chamado com o modelo emprestado (``models.acquire``), antes
+        da geração. Retorna ``"hit"``, ``"miss"`` ou None se o backend não
+        suportar snapshots.
+        """
+        client = getattr(llm, "client", None)
+        if client is None or not hasattr(client, "save_state"):
+            return None
+
+        key = (getattr(llm, "model_path", None), prefix)
+        with self._lock:
+            entry = self._states.get(key)
+            if entry is not None:
+                self._states.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if entry is not None:
+            client.load_state(entry[0])
+            return "hit"
+
+        # Avaliar o prefixo uma vez e guardar o estado resultante
+        logging.info(f"Avaliando prefixo estático do prompt ({len(prefix)} caracteres)")
+        client.reset()
+        client.eval(client.tokenize(prefix.encode("utf-8")))
+        state = client.save_state()
+        self._put(key, state, getattr(state, "llama_state_size", 0))
+        return "miss"
+
+    def _put(self, key, state, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._states.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._states[key] = (state, size)
+            self._size += size
+            while self._states and (len(self._states) > self.max_entries or self._size > self.max_bytes):
+                _, (_, evicted_size) = self._states.popitem(last=False)
+                self._size -= evicted_size
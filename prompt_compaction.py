@@ -0,0 +1,86 @@
+"""
+Compactação estrutural do JSON de entrada para o prompt de mapeamento.
+
+O mapeamento depende apenas da estrutura do documento, então o prompt recebe
+um esqueleto: as chaves, um valor de exemplo por campo, um único item
+representativo por lista e strings longas truncadas. O esqueleto é medido com
+o tokenizer do próprio modelo e reduzido até caber no orçamento de tokens.
+"""
+import json
+import logging
+
+# Níveis de compactação, do mais fiel ao mais agressivo
+_LEVELS = [
+    {"max_string": 48, "max_keys": None, "max_depth": None, "indent": 2},
+    {"max_string": 16, "max_keys": None, "max_depth": None, "indent": 2},
+    {"max_string": 16, "max_keys": None, "max_depth": None, "indent": None},
+    {"max_string": 8, "max_keys": 24, "max_depth": 8, "indent": None},
+    {"max_string": 0, "max_keys": 12, "max_depth": 5, "indent": None},
+]
+
+# Quantidade de itens de cada lista combinados no item representativo
+_SAMPLE_ITEMS = 100
+
+
+def _merge(items):
+    # Item representativo: a união das chaves dos itens amostrados
+    if not all(isinstance(item, dict) for item in items):
+        return items[0]
+    merged = {}
+    for item in items:
+        for key, value in item.items():
+            if key not in merged:
+                merged[key] = value
+            elif isinstance(value, dict) and isinstance(merged[key], dict):
+                merged[key] = _merge([merged[key], value])
+    return merged
+
+
+def structural_skeleton(value, max_string=48, max_keys=None, max_depth=None, _depth=0):
+    """
+    Reduz o JSON ao seu esqueleto estrutural.
+    """
+    if isinstance(value, dict):
+        if max_depth is not None and _depth >= max_depth:
+            return "{...}"
+        items = list(value.items())
+        skeleton = {
+            key: structural_skeleton(item, max_string, max_keys, max_depth, _depth + 1)
+            for key, item in items[:max_keys]
+        }
+        if max_keys is not None and len(items) > max_keys:
+            skeleton["..."] = f"+{len(items) - max_keys} keys"
+        return skeleton
+
+    if isinstance(value, list):
+        if not value:
+            return []
+        if max_depth is not None and _depth >= max_depth:
+            return ["..."]
+        return [structural_skeleton(_merge(value[:_SAMPLE_ITEMS]), max_string, max_keys, max_depth, _depth + 1)]
+
+    if isinstance(value, str):
+        if max_string == 0:
+            return "string"
+        if len(value) > max_string:
+            return value[:max_string] + "..."
+    return value
+
+
+def fit_json_input(json_input, count_tokens, token_budget):
+    """
+    Renderiza o esqueleto de ``json_input`` no nível mais fiel que caiba em
+    ``token_budget`` tokens, medidos por ``count_tokens``.
+
+    Retorna o texto e a quantidade de tokens.
+    """
+    for level in _LEVELS:
+        settings = dict(level)
+        indent = settings.pop("indent")
+        text = json.dumps(structural_skeleton(json_input, **settings), indent=indent, ensure_ascii=False)
+        tokens = count_tokens(text)
+        if tokens <= token_budget:
+            return text, tokens
+
+    logging.warning(f"Esqueleto do JSON com {tokens} tokens excede o orçamento de {token_budget} tokens")
+    return text, tokens
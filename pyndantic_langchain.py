@@ -1,15 +1,29 @@
+import asyncio
+import logging
 import os
-from langchain.llms import OpenAI
-from langchain.chat_models import ChatOpenAI
+import string
+from typing import List
 from langchain.prompts.chat import (
     ChatPromptTemplate,
     HumanMessagePromptTemplate
     )
 from langchain.output_parsers import PydanticOutputParser
+from langchain_core.exceptions import OutputParserException
+import numpy as np
+import pandas as pd
 from pydantic import BaseModel, Field
+from model_registry import models
+from openai_batch import RETRYABLE_ERRORS
+
+MODEL_NAME = "chat-openai"
+model = models.get(MODEL_NAME)
 
-api_key = os.environ['OPENAI_API_KEY']
-model = ChatOpenAI(openai_api_key=api_key, temperature=0)
+# Sharded generation: the list is requested in SHARDS smaller concurrent
+# requests (1 = a single request, as before, at most one per letter);
+# failed shards are retried alone
+PLAYERS_COUNT = int(os.environ.get("PLAYERS_COUNT", "100"))
+SHARDS = int(os.environ.get("PLAYERS_SHARDS", "5"))
+SHARD_RETRIES = int(os.environ.get("PLAYERS_SHARD_RETRIES", "2"))
 
 # ---- DEFINE OUTPUT DATA TYPES WITHIN THE CLASS AND INITILIAZE A PARSER ----
 class Players(BaseModel):
@@ -19,25 +33,117 @@ class Players(BaseModel):
 
 parser = PydanticOutputParser(pydantic_object=Players)
 
+
+# A shard only carries the list: scalar fields (city) are reduced from the
+# merged data, and every item is validated on its own shard
+class Player(BaseModel):
+
+    name: str = Field(description='Player full name')
+    nationality: str = Field(description='Player nationality (country)')
+
+
+class PlayersShard(BaseModel):
+
+    values: List[Player] = Field(description='List of players with name and nationality')
+
+shard_parser = PydanticOutputParser(pydantic_object=PlayersShard)
+
 # ---------------------------- SETUP THE REQUEST -----------------------------
 human_prompt = HumanMessagePromptTemplate.from_template("{request}\n{format_instructions}")
 chat_prompt = ChatPromptTemplate.from_messages([human_prompt])
 
-request = chat_prompt.format_prompt(
-    request='Give me facts about 100 NBA players around the world',
-    format_instructions=parser.get_format_instructions()
-).to_messages()
 
-results = model(request, temperature=0)
-results_values = parser.parse(results.content)  # Player class object
+def shard_requests(count, shards):
+    # Disjoint shards: each one asks for the players whose last name starts
+    # with a range of letters, so the shards do not repeat the same players
+    shards = min(shards, len(string.ascii_uppercase))
+    ranges = [''.join(group) for group in np.array_split(list(string.ascii_uppercase), shards)]
+    per_shard = -(-count // shards)
+    return [
+        f'Give me facts about {per_shard} NBA players around the world '
+        f'whose last name starts with a letter from {group[0]} to {group[-1]}'
+        for group in ranges
+    ]
 
 
-# ----------------------------- SHOW THE RESULTS -----------------------------
-import pandas as pd
+async def generate_shard(request, semaphore):
+    messages = chat_prompt.format_prompt(
+        request=request,
+        format_instructions=shard_parser.get_format_instructions()
+    ).to_messages()
+    async with semaphore:
+        result = await model.ainvoke(messages)
+    return shard_parser.parse(getattr(result, 'content', result))  # PlayersShard class object
+
 
-results_dataframe = pd.DataFrame.from_dict(results_values.values)
+async def generate_sharded(requests, retries=SHARD_RETRIES):
+    """
+    Runs the shard requests concurrently, merging each valid shard into the
+    DataFrame as soon as it arrives and retrying only the failed shards.
+    """
+    # Same concurrency limit the model registry applies to this model
+    semaphore = asyncio.Semaphore(models.max_concurrency(MODEL_NAME))
+    frame = pd.DataFrame(columns=['name', 'nationality'])
+    pending = list(requests)
+    for attempt in range(retries + 1):
+        tasks = {asyncio.ensure_future(generate_shard(request, semaphore)): request for request in pending}
+        transient = False
+        try:
+            for task in asyncio.as_completed(tasks):
+                try:
+                    shard = await task
+                except OutputParserException as e:
+                    logging.warning(f'Invalid shard: {str(e).splitlines()[0]}')
+                    continue
+                except RETRYABLE_ERRORS as e:
+                    # Rate limit, timeout or connection error: only this shard is retried
+                    logging.warning(f'Shard request failed: {type(e).__name__}: {e}')
+                    transient = True
+                    continue
+                rows = pd.DataFrame([player.model_dump() for player in shard.values], columns=frame.columns)
+                frame = pd.concat([frame, rows], ignore_index=True)
+                frame = frame.loc[~frame['name'].str.strip().str.lower().duplicated()].reset_index(drop=True)
+                print(f'{len(frame)} players merged')
+        except BaseException:
+            # Any other error is fatal: do not leave the other shards running
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        # asyncio.as_completed does not say which request failed
+        pending = [request for task, request in tasks.items() if task.exception() is not None]
+        if not pending:
+            break
+        if attempt < retries:
+            print(f'Retrying {len(pending)} failed shard(s)')
+            if transient:
+                await asyncio.sleep(2 ** attempt)
+    if pending:
+        logging.warning(f'{len(pending)} shard(s) still failed after {retries} retries')
+    return frame
 
+
+if SHARDS > 1:
+    results_dataframe = asyncio.run(generate_sharded(shard_requests(PLAYERS_COUNT, SHARDS)))
+    # Scalar field reduced from the merged data instead of asked to the model
+    nationalities = results_dataframe['nationality'].mode()
+    results_values = Players(
+        values=results_dataframe.to_dict('records'),
+        city=nationalities.iloc[0] if len(nationalities) else '',
+    )
+else:
+    request = chat_prompt.format_prompt(
+        request=f'Give me facts about {PLAYERS_COUNT} NBA players around the world',
+        format_instructions=parser.get_format_instructions()
+    ).to_messages()
+
+    results = model(request, temperature=0)
+    results_values = parser.parse(results.content)  # Player class object
+    results_dataframe = pd.DataFrame.from_dict(results_values.values)
+
+
+# ----------------------------- SHOW THE RESULTS -----------------------------
 print(results_dataframe.head(10))
 print(results_dataframe.shape)
 
-print(f'The most popular city across the results is {results_values.city}')
\ No newline at end of file
+print(f'The most popular city across the results is {results_values.city}')
@@ -0,0 +1,89 @@
+"""
+Validação dos dados extraídos contra a lista de ``ResponseSchema``.
+
+Quando os dados extraídos já têm todos os campos do schema, com valores
+presentes e do tipo declarado, não há o que pedir ao modelo.
+"""
+from langchain.schema import OutputParserException
+
+from grammar import schema_type_rule
+
+# Tipos JSON aceitos para cada regra de tipo do schema
+_TYPE_CHECKS = {
+    "value": lambda value: True,
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "array": lambda value: isinstance(value, list),
+    "object": lambda value: isinstance(value, dict),
+}
+
+
+def _is_missing(value) -> bool:
+    # ``extract_data`` devolve {} para caminhos inexistentes e None para nulos
+    if value is None or value == {}:
+        return True
+    # Projeção de lista em que nenhum item tinha as chaves mapeadas
+    if isinstance(value, list) and value and all(
+        isinstance(item, dict) and all(field is None for field in item.values()) for item in value
+    ):
+        return True
+    return False
+
+
+def find_schema_problems(data, response_schemas) -> dict:
+    """
+    Campos ausentes ou ambíguos nos dados extraídos, com o motivo de cada um.
+    """
+    if not isinstance(data, dict):
+        return {schema.name: "missing" for schema in response_schemas}
+
+    problems = {}
+    for schema in response_schemas:
+        value = data.get(schema.name)
+        if _is_missing(value):
+            problems[schema.name] = "missing"
+        elif not _TYPE_CHECKS[schema_type_rule(schema.type)](value):
+            problems[schema.name] = "type"
+    return problems
+
+
+def conform_to_schemas(data, response_schemas) -> dict:
+    """
+    Apenas os campos do schema, na ordem do schema.
+    """
+    return {schema.name: data[schema.name] for schema in response_schemas if schema.name in data}
+
+
+def check_output(value, response_schemas) -> dict:
+    """
+    Valida a saída já decodificada da LLM como o ``StructuredOutputParser``:
+    um objeto com todas as chaves do schema. Evita reserializar e parsear de
+    novo o JSON que o parser incremental já validou.
+    """
+    if not isinstance(value, dict):
+        raise OutputParserException(f"Got invalid return object. Expected a JSON object, but got: {value!r}")
+    missing = [schema.name for schema in response_schemas if schema.name not in value]
+    if missing:
+        raise OutputParserException(
+            f"Got invalid return object. Expected key `{missing[0]}` to be present, but got {value}"
+        )
+    return value
+
+
+def check_mapping(value, response_schemas) -> dict:
+    """
+    Valida o mapeamento gerado pela LLM antes de ele ir para o cache de
+    mapeamentos: um objeto com uma entrada para cada chave do schema, cada uma
+    um objeto (valor) ou uma lista cujo primeiro item é um objeto (lista).
+    """
+    if not isinstance(value, dict):
+        raise OutputParserException(f"Got invalid mapping. Expected a JSON object, but got: {value!r}")
+    missing = [schema.name for schema in response_schemas if schema.name not in value]
+    if missing:
+        raise OutputParserException(f"Got invalid mapping. Expected key `{missing[0]}` to be present, but got {value}")
+    for key, entry in value.items():
+        if not (isinstance(entry, dict) or (isinstance(entry, list) and entry and isinstance(entry[0], dict))):
+            raise OutputParserException(f"Got invalid mapping. Unexpected entry for key `{key}`: {entry!r}")
+    return value
@@ -0,0 +1,186 @@
+"""
+Cache semântico das respostas do chat.
+
+Perguntas com as mesmas palavras em outra ordem ou com pequenas variações
+("o que é X?" / "me explique X") recebem a resposta já gerada em vez de uma
+nova geração completa do modelo. Cada pergunta é convertida num embedding
+(``Embeddings`` do LangChain, por exemplo ``LlamaCppEmbeddings`` do registro
+de modelos) e guardada, já normalizada, numa matriz ``float32`` do NumPy: a
+busca é um único produto matriz-vetor (similaridade de cosseno) contra todas
+as perguntas anteriores. Uma resposta só é reaproveitada quando a
+similaridade passa de ``threshold``.
+
+O índice tem no máximo ``max_entries`` perguntas (as menos usadas são
+descartadas) e é salvo num único arquivo ``.npz``, sem pickle.
+"""
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+import json_codec
+from metrics import cache_requests
+
+
+class SemanticCache:
+    """
+    Índice de perguntas já respondidas, consultado por similaridade.
+
+    ``model`` identifica o modelo de embeddings: um arquivo salvo com outro
+    modelo (ou outra dimensão) é ignorado ao carregar.
+    """
+
+    def __init__(self, embeddings, path=None, threshold=0.92, max_entries=1024, model=""):
+        self.embeddings = embeddings
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.model = model
+        self._vectors = None  # matriz (capacidade, dimensão), só as ``_size`` primeiras linhas valem
+        self._accessed = np.zeros(0)
+        self._size = 0
+        self._questions = []
+        self._answers = []
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        return self._size
+
+    def _embed(self, question):
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        if vector.ndim == 2:
+            vector = vector.mean(axis=0)  # um vetor por token: pooling médio
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _search(self, vector):
+        # Índice e similaridade da pergunta mais parecida; chamado com ``_lock``
+        if not self._size or vector.shape[0] != self._vectors.shape[1]:
+            return -1, -1.0
+        scores = self._vectors[:self._size] @ vector
+        index = int(np.argmax(scores))
+        return index, float(scores[index])
+
+    def lookup(self, question: str):
+        """
+        Resposta de uma pergunta parecida, ou None.
+        """
+        vector = self._embed(question)
+        with self._lock:
+            index, score = self._search(vector)
+            if score < self.threshold:
+                self._stats["misses"] += 1
+                cache_requests.inc(cache="semantic", result="miss")
+                return None
+            self._accessed[index] = time.time()
+            self._stats["hits"] += 1
+            cache_requests.inc(cache="semantic", result="hit")
+            logging.info(f"Cache semântico: {question!r} ~ {self._questions[index]!r} ({score:.3f})")
+            return self._answers[index]
+
+    def update(self, question: str, answer: str):
+        """
+        Guarda a resposta. Uma pergunta parecida com uma já guardada substitui
+        a resposta anterior em vez de ocupar outra entrada.
+        """
+        vector = self._embed(question)
+        with self._lock:
+            index, score = self._search(vector)
+            if score < self.threshold:
+                index = self._append(vector)
+                self._questions.append(question)
+                self._answers.append(answer)
+            else:
+                self._vectors[index] = vector
+                self._questions[index] = question
+                self._answers[index] = answer
+            self._accessed[index] = time.time()
+
+    def _append(self, vector):
+        # Chamado com ``_lock``: abre espaço para mais uma linha na matriz
+        if self._vectors is None or vector.shape[0] != self._vectors.shape[1]:
+            # Primeiro uso ou outro modelo de embeddings: recomeçar o índice
+            self._vectors = np.zeros((16, vector.shape[0]), dtype=np.float32)
+            self._accessed = np.zeros(16)
+            self._size = 0
+            self._questions, self._answers = [], []
+        if self._size >= self.max_entries:
+            self._evict()
+        if self._size == len(self._vectors):
+            capacity = min(2 * len(self._vectors), max(self.max_entries, 1))
+            self._vectors = np.resize(self._vectors, (capacity, self._vectors.shape[1]))
+            self._accessed = np.resize(self._accessed, capacity)
+        self._vectors[self._size] = vector
+        self._size += 1
+        return self._size - 1
+
+    def _evict(self):
+        # Chamado com ``_lock``: descarta o último quarto menos usado de uma vez,
+        # para não reorganizar a matriz a cada pergunta nova
+        count = max(1, self._size // 4)
+        keep = np.sort(np.argsort(self._accessed[:self._size])[count:])
+        kept = len(keep)
+        self._vectors[:kept] = self._vectors[keep]
+        self._accessed[:kept] = self._accessed[keep]
+        self._questions = [self._questions[index] for index in keep]
+        self._answers = [self._answers[index] for index in keep]
+        self._size = kept
+        self._stats["evictions"] += count
+
+    def clear(self):
+        with self._lock:
+            self._vectors = None
+            self._accessed = np.zeros(0)
+            self._size = 0
+            self._questions, self._answers = [], []
+
+    def stats(self) -> dict:
+        """
+        Acertos, falhas, remoções e número de perguntas no índice.
+        """
+        with self._lock:
+            return {**self._stats, "entries": self._size}
+
+    def save(self):
+        """
+        Grava o índice em ``path`` (escrita atômica).
+        """
+        if not self.path:
+            return
+        with self._lock:
+            size = self._size
+            vectors = self._vectors[:size] if size else np.zeros((0, 0), dtype=np.float32)
+            accessed = self._accessed[:size]
+            entries = json_codec.dumps({"model": self.model, "questions": self._questions, "answers": self._answers})
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "wb") as file:
+            np.savez(file, vectors=vectors, accessed=accessed, entries=np.array(entries))
+        os.replace(temporary, self.path)
+
+    def _load(self):
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                vectors = data["vectors"].astype(np.float32)
+                accessed = data["accessed"].astype(np.float64)
+                entries = json_codec.loads(str(data["entries"]))
+        except (OSError, KeyError, ValueError) as e:
+            logging.warning(f"Cache semântico em {self.path} ignorado: {e}")
+            return
+        if entries.get("model") != self.model or not len(vectors):
+            logging.info(f"Cache semântico em {self.path} é de outro modelo de embeddings, ignorado")
+            return
+        self._vectors = vectors
+        self._accessed = accessed
+        self._size = len(vectors)
+        self._questions = entries["questions"]
+        self._answers = entries["answers"]
+        while self._size > self.max_entries:
+            self._evict()
@@ -0,0 +1,105 @@
+"""
+Resultados intermediários da execução passo a passo do workflow.
+
+Cada execução (``run_id``) guarda as saídas das etapas já concluídas, para que
+a etapa seguinte leia suas entradas daqui em vez de recalcular as anteriores.
+As execuções expiram após ``ttl`` segundos sem uso e as menos usadas são
+descartadas quando o total ultrapassa ``max_runs`` ou ``max_bytes``.
+"""
+from collections import OrderedDict
+import threading
+import time
+import uuid
+
+import json_codec
+
+
+class RunNotFound(KeyError):
+    """
+    A execução não existe ou já expirou.
+    """
+
+
+def _size(values) -> int:
+    # Tamanho aproximado, pela serialização JSON
+    return len(json_codec.dumps(values, default=str))
+
+
+class StepStore:
+    """
+    Armazenamento em memória, com TTL e limite de memória, dos valores de
+    cada execução.
+    """
+
+    def __init__(self, ttl=3600, max_runs=1000, max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_runs = max_runs
+        self.max_bytes = max_bytes
+        self._runs = OrderedDict()  # run_id -> [valores, tamanho, último uso]
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def create(self, values=None) -> str:
+        """
+        Inicia uma execução e retorna seu id.
+        """
+        run_id = uuid.uuid4().hex
+        values = dict(values or {})
+        with self._lock:
+            self._runs[run_id] = [values, _size(values), time.monotonic()]
+            self._size += self._runs[run_id][1]
+            self._evict()
+        return run_id
+
+    def get(self, run_id) -> dict:
+        """
+        Valores da execução (cópia rasa). Levanta ``RunNotFound``.
+        """
+        with self._lock:
+            entry = self._entry(run_id)
+            return dict(entry[0])
+
+    def update(self, run_id, values, discard=()):
+        """
+        Grava as saídas de uma etapa, descartando as chaves em ``discard``
+        (saídas de etapas posteriores que deixam de valer).
+        """
+        with self._lock:
+            entry = self._entry(run_id)
+            merged = {key: value for key, value in entry[0].items() if key not in discard}
+            merged.update(values)
+            size = _size(merged)
+            self._size += size - entry[1]
+            entry[0], entry[1] = merged, size
+            self._evict()
+
+    def __len__(self):
+        return len(self._runs)
+
+    def _entry(self, run_id):
+        # Chamado com ``_lock`` adquirido
+        entry = self._runs.get(run_id)
+        now = time.monotonic()
+        if entry is None or now - entry[2] > self.ttl:
+            if entry is not None:
+                self._remove(run_id)
+            raise RunNotFound(run_id)
+        entry[2] = now
+        self._runs.move_to_end(run_id)
+        return entry
+
+    def _remove(self, run_id):
+        _, size, _ = self._runs.pop(run_id)
+        self._size -= size
+
+    def _evict(self):
+        # As execuções estão em ordem de uso: as expiradas ficam no início
+        now = time.monotonic()
+        while self._runs:
+            run_id, entry = next(iter(self._runs.items()))
+            if now - entry[2] <= self.ttl:
+                break
+            self._remove(run_id)
+        # A execução mais recente é mantida mesmo que sozinha ultrapasse o limite
+        while len(self._runs) > 1 and (len(self._runs) > self.max_runs or self._size > self.max_bytes):
+            self._remove(next(iter(self._runs)))
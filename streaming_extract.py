@@ -0,0 +1,346 @@
+"""
+Extração em streaming para JSONs maiores que a memória.
+
+O documento é lido de um arquivo mapeado em memória (mmap) ou de um stream de
+bytes em blocos, sem ser decodificado por inteiro: os caminhos do mapeamento
+formam uma árvore de prefixos, os ramos que o mapeamento não usa são pulados
+byte a byte e apenas os valores nos caminhos mapeados são materializados. O
+uso de memória acompanha o tamanho da saída, não o da entrada.
+
+``extract_stream`` produz exatamente a mesma saída que ``extract_data`` (o
+documento podado é entregue ao mapeamento compilado) e ``iter_rows`` percorre
+uma projeção de lista item a item, entregando as linhas sob demanda.
+"""
+from contextlib import contextmanager
+import json
+import mmap
+import os
+import re
+
+from mapping_engine import compile_mapping, plan_mapping
+
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_SCALAR = re.compile(rb"[^\s,\]}]+")
+_INTEGER = re.compile(rb"-?(?:0|[1-9][0-9]*)\Z")
+_LITERAL_VALUES = {b"true": True, b"false": False, b"null": None}
+# Chave de objeto com os dois-pontos, e o separador depois de cada valor
+_KEY = re.compile(rb'[ \t\n\r]*"([^"\\]*(?:\\.[^"\\]*)*)"[ \t\n\r]*:', re.DOTALL)
+_SEPARATOR = re.compile(rb"[ \t\n\r]*([,\]}])")
+# Ao pular um contêiner: texto e strings completas até o próximo delimitador.
+# O grupo 1 é o delimitador, ``"`` se uma string continua além do buffer, ou
+# vazio no fim do buffer (o padrão é linear, sem retrocesso)
+_SKIP_RUN = re.compile(rb'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*([\[\]{}"]|\Z)', re.DOTALL)
+
+_OBJECT, _ARRAY, _QUOTE = b"{"[0], b"["[0], b'"'[0]
+_OBJECT_END, _ARRAY_END, _COMMA = b"}"[0], b"]"[0], b","[0]
+
+# Tamanho dos blocos lidos de streams que não podem ser mapeados em memória
+CHUNK_SIZE = 1024 * 1024
+
+
+class _PathNode:
+    """
+    Nó da árvore de caminhos. ``full`` indica que o valor inteiro é usado
+    pelo mapeamento; caso contrário, só as chaves em ``children``. Um nó
+    ``flat`` só tem filhos ``full`` (por exemplo, os itens de uma projeção de
+    lista): seus objetos são decodificados de uma vez e depois podados.
+    """
+
+    __slots__ = ("children", "full", "flat")
+
+    def __init__(self):
+        self.children = {}
+        self.full = False
+        self.flat = False
+
+    def add(self, path):
+        node = self
+        for step in path:
+            node = node.children.setdefault(step, _PathNode())
+        return node
+
+    def freeze(self):
+        for child in self.children.values():
+            child.freeze()
+        self.flat = not self.full and bool(self.children) and all(child.full for child in self.children.values())
+        return self
+
+
+def path_tree(mapping) -> _PathNode:
+    """
+    Árvore com os caminhos usados pelo mapeamento. Nas projeções de lista,
+    apenas as chaves de origem de cada item são usadas.
+    """
+    root = _PathNode()
+    for field in plan_mapping(mapping):
+        node = root.add(field.path)
+        if field.kind == "value":
+            node.full = True
+        else:
+            for _, source_key in field.projection:
+                node.add((source_key,)).full = True
+    return root.freeze()
+
+
+class _Reader:
+    """
+    Leitor de tokens sobre um buffer de bytes (mmap ou bytes) ou sobre um
+    stream lido em blocos, descartando o que já foi consumido.
+    """
+
+    def __init__(self, data=None, stream=None, chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buf = data if stream is None else bytearray()
+        self.eof = stream is None
+        self.pos = 0
+        self.mark = None  # início do valor sendo materializado
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        keep = self.pos if self.mark is None else self.mark
+        del self.buf[:keep]
+        self.buf += chunk
+        self.pos -= keep
+        if self.mark is not None:
+            self.mark -= keep
+        return True
+
+    def error(self, message):
+        return ValueError(f"JSON inválido: {message}")
+
+    def match(self, pattern):
+        # Um token no fim do buffer pode continuar no próximo bloco
+        while True:
+            found = pattern.match(self.buf, self.pos)
+            if found is not None and (found.end() < len(self.buf) or self.eof):
+                return found
+            if not self.fill():
+                return found
+
+    def peek(self) -> int:
+        self.pos = self.match(_WHITESPACE).end()
+        while self.pos >= len(self.buf):
+            if not self.fill():
+                raise self.error("fim inesperado do documento")
+            self.pos = self.match(_WHITESPACE).end()
+        return self.buf[self.pos]
+
+    def expect(self, byte):
+        if self.peek() != byte:
+            raise self.error(f"esperado {chr(byte)!r} na posição {self.pos}")
+        self.pos += 1
+
+    def string(self) -> str:
+        found = self.match(_STRING)
+        if found is None:
+            raise self.error(f"string inválida na posição {self.pos}")
+        self.pos = found.end()
+        raw = found.group()
+        return raw[1:-1].decode("utf-8") if b"\\" not in raw else json.loads(raw)
+
+    def skip_value(self):
+        """
+        Avança sobre um valor sem decodificá-lo.
+        """
+        char = self.peek()
+        if char == _QUOTE:
+            self.string()
+            return
+        if char != _OBJECT and char != _ARRAY:
+            found = self.match(_SCALAR)
+            if found is None:
+                raise self.error(f"valor inválido na posição {self.pos}")
+            self.pos = found.end()
+            return
+
+        depth = 0
+        while True:
+            found = _SKIP_RUN.match(self.buf, self.pos)
+            delimiter = found.group(1)
+            if not delimiter or delimiter[0] == _QUOTE:
+                # Fim do buffer ou string cortada: continuar com o próximo bloco
+                self.pos = found.start(1)
+                if not self.fill():
+                    raise self.error("fim inesperado do documento")
+                continue
+            self.pos = found.end()
+            depth += 1 if delimiter[0] == _OBJECT or delimiter[0] == _ARRAY else -1
+            if depth == 0:
+                return
+
+    def full_value(self):
+        """
+        Decodifica o próximo valor inteiro. Contêineres são decodificados de
+        uma vez pelo ``json`` em C.
+        """
+        char = self.peek()
+        if char == _QUOTE:
+            return self.string()
+        if char == _OBJECT or char == _ARRAY:
+            self.mark = self.pos
+            try:
+                self.skip_value()
+                return json.loads(self.buf[self.mark:self.pos])
+            finally:
+                self.mark = None
+
+        found = self.match(_SCALAR)
+        if found is None:
+            raise self.error(f"valor inválido na posição {self.pos}")
+        self.pos = found.end()
+        token = bytes(found.group())
+        if token in _LITERAL_VALUES:
+            return _LITERAL_VALUES[token]
+        if _INTEGER.match(token):
+            return int(token)
+        return json.loads(token)
+
+    def separator(self, closing):
+        # Consome a vírgula (retorna True) ou o fechamento (retorna False)
+        found = self.match(_SEPARATOR)
+        if found is None or found.group(1)[0] not in (_COMMA, closing):
+            raise self.error(f"',' ou {chr(closing)!r} esperado na posição {self.pos}")
+        self.pos = found.end()
+        return found.group(1)[0] == _COMMA
+
+    def object_keys(self):
+        """
+        Itera as chaves do objeto atual; o chamador consome cada valor.
+        """
+        self.expect(_OBJECT)
+        if self.peek() == _OBJECT_END:
+            self.pos += 1
+            return
+        while True:
+            found = self.match(_KEY)
+            if found is None:
+                raise self.error(f"chave esperada na posição {self.pos}")
+            self.pos = found.end()
+            raw = found.group(1)
+            yield raw.decode("utf-8") if b"\\" not in raw else json.loads(b'"' + raw + b'"')
+            if not self.separator(_OBJECT_END):
+                return
+
+    def array_items(self):
+        """
+        Itera os itens do array atual; o chamador consome cada valor.
+        """
+        self.expect(_ARRAY)
+        if self.peek() == _ARRAY_END:
+            self.pos += 1
+            return
+        while True:
+            yield
+            if not self.separator(_ARRAY_END):
+                return
+
+    def pruned_value(self, node):
+        """
+        Decodifica apenas as partes do valor usadas pela árvore de caminhos.
+        Listas são transparentes: o mesmo nó vale para cada item, como no
+        percurso de ``extract_data``.
+        """
+        if node.full:
+            return self.full_value()
+        char = self.peek()
+        if char == _OBJECT and node.flat:
+            # Objeto pequeno com todas as chaves usadas inteiras: o json em C
+            # decodifica mais rápido do que percorrer chave a chave
+            value = self.full_value()
+            return {key: value[key] for key in node.children if key in value}
+        if char == _OBJECT:
+            result = {}
+            for key in self.object_keys():
+                child = node.children.get(key)
+                if child is None:
+                    self.skip_value()
+                else:
+                    result[key] = self.pruned_value(child)
+            return result
+        if char == _ARRAY:
+            return [self.pruned_value(node) for _ in self.array_items()]
+        return self.full_value()
+
+
+@contextmanager
+def open_reader(source, chunk_size=CHUNK_SIZE):
+    """
+    Leitor para um caminho de arquivo, arquivo aberto em modo binário,
+    stream de bytes (``read``) ou ``bytes``. Arquivos são mapeados em memória
+    quando possível.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        yield _Reader(source)
+        return
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as file:
+            with open_reader(file, chunk_size) as reader:
+                yield reader
+        return
+
+    try:
+        mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        # Streams sem arquivo (HTTP, pipes) ou arquivos vazios: leitura em blocos
+        yield _Reader(stream=source, chunk_size=chunk_size)
+        return
+    try:
+        yield _Reader(mapped)
+    finally:
+        mapped.close()
+
+
+def extract_stream(source, mapping, chunk_size=CHUNK_SIZE):
+    """
+    Extrai os dados de um JSON em arquivo ou stream, com a mesma saída de
+    ``extract_data``, materializando apenas os valores mapeados.
+    """
+    with open_reader(source, chunk_size) as reader:
+        document = reader.pruned_value(path_tree(mapping))
+    return compile_mapping(mapping).extract(document)
+
+
+def iter_rows(source, mapping, key, chunk_size=CHUNK_SIZE):
+    """
+    Linhas da projeção de lista ``key`` do mapeamento, uma a uma, enquanto o
+    documento é lido.
+
+    O caminho da lista deve passar apenas por objetos; um caminho inexistente
+    não produz linhas. Para caminhos que atravessam listas, use
+    ``extract_stream``.
+    """
+    field = next((field for field in plan_mapping(mapping) if field.key == key), None)
+    if field is None or field.kind != "list":
+        raise KeyError(f"O mapeamento não tem a projeção de lista {key!r}")
+
+    item_node = _PathNode()
+    for _, source_key in field.projection:
+        item_node.add((source_key,)).full = True
+    item_node.freeze()
+
+    with open_reader(source, chunk_size) as reader:
+        # Descer pelos objetos do caminho, pulando as demais chaves
+        for step in field.path:
+            if reader.peek() != _OBJECT:
+                if reader.peek() == _ARRAY:
+                    raise ValueError(f"O caminho de {key!r} atravessa uma lista; use extract_stream.")
+                return
+            for found in reader.object_keys():
+                if found == step:
+                    break
+                reader.skip_value()
+            else:
+                return
+
+        if reader.peek() != _ARRAY:
+            return
+        for _ in reader.array_items():
+            item = reader.pruned_value(item_node)
+            yield {sub_key: item.get(source_key) for sub_key, source_key in field.projection}
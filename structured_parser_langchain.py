@@ -1,6 +1,7 @@
 from langchain.output_parsers import StructuredOutputParser, ResponseSchema
 from langchain.prompts import PromptTemplate
-from langchain.llms import OpenAI
+from mapping_engine import extract_data
+from model_registry import models
 import json
 
 # Exemplo de JSON de entrada
@@ -48,55 +49,6 @@ prompt = PromptTemplate(
     partial_variables={"format_instructions": format_instructions}
 )
 
-# Função para extrair dados dinamicamente
-def extract_data(data, mapping):
-    """
-    Extrai dados dinamicamente de um JSON usando um mapeamento.
-
-    :param data: JSON de entrada
-    :param mapping: Dicionário de mapeamento que define como os dados devem ser extraídos
-    :return: JSON transformado
-    """
-    output = {}
-
-    for key, value in mapping.items():
-        if isinstance(value, dict):
-            # Se o valor for um dicionário, significa que precisamos navegar mais fundo no JSON
-            path = value.get("path", [])
-            default = value.get("default", None)
-            current_data = data
-
-            # Percorre o caminho no JSON
-            for step in path:
-                current_data = current_data.get(step, {}) if isinstance(current_data, dict) else None
-                if current_data is None:
-                    break
-
-            # Adiciona o valor ao JSON de saída
-            output[key] = current_data if current_data is not None else default
-
-        elif isinstance(value, list):
-            # Se o valor for uma lista, significa que precisamos iterar sobre uma lista de objetos
-            path = value[0].get("path", [])
-            current_data = data
-
-            # Percorre o caminho no JSON
-            for step in path:
-                current_data = current_data.get(step, []) if isinstance(current_data, dict) else []
-
-            # Extrai os itens da lista
-            output[key] = []
-            for item in current_data:
-                extracted_item = {}
-                for sub_key, sub_value in value[0].items():
-                    if sub_key == "path":
-                        continue
-                    extracted_item[sub_key] = item.get(sub_value, None)
-                output[key].append(extracted_item)
-
-    return output
-
-
 # Mapeamento para extrair os dados
 mapping = {
     "user_id": {"path": ["data", "user_info", "user_id"]},
@@ -121,8 +73,8 @@ json_input = json.dumps(extracted_data, indent=4)
 # Preencher o prompt com o JSON de entrada
 _input = prompt.format_prompt(json_input=json_input)
 
-# Configurar o modelo de linguagem (OpenAI GPT)
-llm = OpenAI(temperature=0.0)
+# Modelo de linguagem (OpenAI GPT) compartilhado
+llm = models.get("openai")
 
 # Gerar a saída do modelo
 output = llm(_input.to_string())
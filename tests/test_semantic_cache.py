@@ -0,0 +1,98 @@
+"""
+Testes do cache semântico com o embedder determinístico ``HashingEmbeddings``.
+"""
+import itertools
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import semantic_cache
+from fake_llm import HashingEmbeddings
+from semantic_cache import SemanticCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Relógio que avança a cada leitura, para uma ordem de uso sem empates
+    ticks = itertools.count(1)
+    monkeypatch.setattr(semantic_cache, "time", types.SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+def question(index):
+    # Perguntas sem palavras em comum entre si
+    return f"alpha{index} beta{index} gamma{index}"
+
+
+def test_hit_above_threshold_and_miss_below():
+    cache = SemanticCache(HashingEmbeddings(), threshold=0.92)
+    cache.update("what is python", "A programming language.")
+
+    # Mesmas palavras em outra ordem: similaridade 1
+    assert cache.lookup("Python, what is?") == "A programming language."
+    # Duas de três palavras em comum: similaridade 2/3
+    assert cache.lookup("what is rust") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+    loose = SemanticCache(HashingEmbeddings(), threshold=0.6)
+    loose.update("what is python", "A programming language.")
+    assert loose.lookup("what is rust") == "A programming language."
+
+
+def test_similar_question_updates_in_place():
+    cache = SemanticCache(HashingEmbeddings())
+    cache.update("what is python", "old answer")
+    cache.update("is python what", "new answer")
+
+    assert len(cache) == 1
+    assert cache.lookup("what is python") == "new answer"
+
+
+def test_evicts_least_recently_used_quarter(clock):
+    cache = SemanticCache(HashingEmbeddings(), max_entries=8)
+    for index in range(8):
+        cache.update(question(index), f"answer {index}")
+    # Usar as duas perguntas mais antigas: as menos usadas passam a ser 2 e 3
+    assert cache.lookup(question(0)) == "answer 0"
+    assert cache.lookup(question(1)) == "answer 1"
+
+    cache.update(question(8), "answer 8")
+
+    assert len(cache) == 7
+    assert cache.stats()["evictions"] == 2
+    assert cache.lookup(question(2)) is None
+    assert cache.lookup(question(3)) is None
+    for index in (0, 1, 4, 5, 6, 7, 8):
+        assert cache.lookup(question(index)) == f"answer {index}"
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "cache.npz")
+    cache = SemanticCache(HashingEmbeddings(), path=path, model="chat:hashing")
+    for index in range(5):
+        cache.update(question(index), f"answer {index}")
+    cache.save()
+
+    loaded = SemanticCache(HashingEmbeddings(), path=path, model="chat:hashing")
+
+    assert len(loaded) == 5
+    for index in range(5):
+        assert loaded.lookup(question(index)) == f"answer {index}"
+    loaded.update(question(5), "answer 5")
+    assert len(loaded) == 6
+
+
+def test_file_from_another_model_is_ignored(tmp_path):
+    path = str(tmp_path / "cache.npz")
+    cache = SemanticCache(HashingEmbeddings(), path=path, model="chat:hashing")
+    cache.update("what is python", "A programming language.")
+    cache.save()
+
+    other = SemanticCache(HashingEmbeddings(), path=path, model="chat:other-embeddings")
+
+    assert len(other) == 0
+    assert other.lookup("what is python") is None